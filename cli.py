@@ -4,12 +4,14 @@ from cmd import Cmd
 import sys
 from pathlib import Path
 
-from qry.lang import Parser
+from qry.lang import ASTCache, Parser, Optimiser
 from qry.interpreter import Interpreter
 from qry.runtime import QryRuntimeError
-from qry.stdlib.ops import print as print_method
+from qry.stdlib.ops import print as print_method, binop_lookup, unop_lookup
 
 parser = Parser()
+optimiser = Optimiser(binop_lookup, unop_lookup)
+ast_cache = ASTCache(parser, optimiser)
 interpreter = Interpreter()
 
 class QryCmd(Cmd):
@@ -17,7 +19,7 @@ class QryCmd(Cmd):
 
 	def default(self, line: str) -> bool:
 		try:
-			for expr in parser.parse(line):
+			for expr in ast_cache.parse(line, cache = False):
 				val = interpreter.eval(expr)
 				print(f'({type(val).__name__}) ', end = '')
 				print_method.call([val])
@@ -31,6 +33,5 @@ if len(args) == 0:
 	cmd = QryCmd()
 	cmd.cmdloop()
 else:
-	script_file = Path(args[0]).read_text()
-	for expr in parser.parse(script_file):
+	for expr in ast_cache.parse_file(Path(args[0])):
 		interpreter.eval(expr)
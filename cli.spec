@@ -5,10 +5,17 @@ from PyInstaller.building.api import PYZ, EXE, COLLECT
 
 import lark
 
+from qry.lang.parser import write_parser_tables
+
+# serialise the parser tables now rather than building them on every run of the binary
+tables_path = Path('build/qry-parser/grammar.tables')
+write_parser_tables(tables_path)
+
 a = Analysis(
 	['cli.py'],
 	datas = [
 	('qry/lang/grammar.lark', 'qry/lang'),
+	(str(tables_path), 'qry/lang'),
 	(Path(lark.__file__).parent / 'grammars', 'lark/grammars'),
 	],
 	hiddenimports = ['pkg_resources.py2_warn'],
@@ -0,0 +1,29 @@
+from typing import Any, Optional
+from pathlib import Path
+import os
+import pickle
+
+def get_cache_dir() -> Optional[Path]:
+	# QRY_CACHE_DIR overrides the location, and setting it to an empty string disables caching altogether
+	override = os.getenv('QRY_CACHE_DIR')
+	if override is not None:
+		return Path(override) if override else None
+
+	base_dir = os.getenv('XDG_CACHE_HOME')
+	return (Path(base_dir) if base_dir else Path.home() / '.cache') / 'qry'
+
+def read_cache_file(path: Path) -> Any:
+	# anything unreadable is treated as a cache miss
+	try:
+		with path.open('rb') as f:
+			return pickle.load(f)
+	except Exception:
+		return None
+
+def write_cache_file(path: Path, obj: Any) -> None:
+	path.parent.mkdir(parents = True, exist_ok = True)
+	# write then rename, so concurrent processes never see a partial file
+	tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+	with tmp_path.open('wb') as f:
+		pickle.dump(obj, f, protocol = pickle.HIGHEST_PROTOCOL)
+	os.replace(tmp_path, path)
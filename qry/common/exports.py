@@ -31,6 +31,10 @@ def get_all_exported_objs(module: ModuleType) -> List[Any]:
 		obj = getattr(module, name)
 		original_obj_module = get_original_module(obj)
 
+		# instances of exported types (e.g. shared constants) aren't exports in their own right
+		if is_exported(type(obj)):
+			continue
+
 		if is_exported(obj) and original_obj_module and original_obj_module.__name__.startswith(module.__name__):
 			objects.append(obj)
 
@@ -1 +1,2 @@
+from .compiler import *
 from .interpreter import *
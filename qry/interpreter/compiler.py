@@ -0,0 +1,421 @@
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+from qry.stdlib import ops
+from qry.lang import *
+
+from qry.runtime import Environment, Scope, QryRuntimeError, Library, to_py, from_py, unbound
+from qry.runtime import Method, MethodCallSite, Function, BuiltinFunction, Argument, ArgumentMode
+
+CompiledExpr = Callable[[Environment], Any]
+StoreFunc = Callable[[Environment, Any], None]
+
+def _constant(value: Any) -> CompiledExpr:
+	return lambda env: value
+
+def _failure(message: str) -> CompiledExpr:
+	def fail(env: Environment) -> Any:
+		raise QryRuntimeError(message)
+
+	return fail
+
+def _find_in_library(lib: Library, name: str) -> Any:
+	try:
+		return lib.environment.state[name]
+	except KeyError:
+		raise QryRuntimeError(f'not found: {name}') from None
+
+class _LocalsFinder:
+	names: List[str]
+	dynamic: bool
+
+	def __init__(self) -> None:
+		self.names = []
+		self.dynamic = False
+
+	def _add(self, target: Expr) -> None:
+		if isinstance(target, IdentExpr) and target.value not in self.names:
+			self.names.append(target.value)
+
+	def visit(self, expr: Expr) -> None:
+		if isinstance(expr, BinaryOpExpr):
+			if expr.op == BinaryOp.LASSIGN:
+				self._add(expr.lhs)
+				self.visit(expr.rhs)
+			elif expr.op == BinaryOp.RASSIGN:
+				self._add(expr.rhs)
+				self.visit(expr.lhs)
+			elif expr.op == BinaryOp.ACCESS:
+				self.visit(expr.lhs)
+			else:
+				self.visit(expr.lhs)
+				self.visit(expr.rhs)
+		elif isinstance(expr, UnaryOpExpr):
+			self.visit(expr.arg)
+		elif isinstance(expr, CallExpr):
+			self.visit(expr.func)
+			for e in expr.positional_args + list(expr.named_args.values()):
+				self.visit(e)
+		elif isinstance(expr, FuncExpr):
+			# nested bodies get their own scope, but the function itself is a local
+			if expr.name is not None and expr.name not in self.names:
+				self.names.append(expr.name)
+			for e in list(expr.args.values()) + [expr.return_type]:
+				self.visit(e)
+		elif isinstance(expr, InterpolateExpr):
+			self.visit(expr.contents)
+		elif isinstance(expr, UseExpr):
+			# imports can introduce arbitrary names, so we can't resolve anything ahead of time
+			self.dynamic = True
+
+def _function_scope(expr: FuncExpr, parent: Optional[Scope]) -> Optional[Scope]:
+	finder = _LocalsFinder()
+	finder.names.extend(expr.args.keys())
+	for e in expr.body:
+		finder.visit(e)
+
+	if finder.dynamic:
+		return None
+
+	return Scope({name: index for index, name in enumerate(finder.names)}, parent)
+
+# compiles each node once into a closure, cached on the node itself
+# dispatch on node types, ops and argument handling is all resolved here rather than per evaluation
+# within function bodies, locals are resolved to (depth, slot) addresses using the enclosing scopes
+class Compiler:
+	def compile(self, expr: Expr, scope: Optional[Scope] = None) -> CompiledExpr:
+		code = expr.compiled
+		if code is None:
+			code = getattr(self, f'_compile_{type(expr).__name__}')(expr, scope)
+			expr.compiled = code
+		return code
+
+	def _compile_BinaryOpExpr(self, expr: BinaryOpExpr, scope: Optional[Scope]) -> CompiledExpr:
+		if expr.op == BinaryOp.LASSIGN:
+			return self._compile_assign(expr.lhs, expr.rhs, scope)
+		elif expr.op == BinaryOp.RASSIGN:
+			return self._compile_assign(expr.rhs, expr.lhs, scope)
+		elif expr.op == BinaryOp.ACCESS:
+			return self._compile_access(expr, scope)
+		elif expr.op == BinaryOp.PIPE:
+			if not isinstance(expr.rhs, CallExpr):
+				return _failure(f'can only pipe into function calls: {expr.render()}')
+
+			# build a new call node rather than modifying the original rhs
+			call = expr.rhs
+			piped = CallExpr(call.source, call.func, [expr.lhs] + call.positional_args, call.named_args)
+			return self.compile(piped, scope)
+
+		lhs = self.compile(expr.lhs, scope)
+		rhs = self.compile(expr.rhs, scope)
+		call_method = MethodCallSite(ops.binop_lookup[expr.op]).call
+
+		short_circuit_value = short_circuit_values.get(expr.op)
+		if short_circuit_value is not None:
+
+			def short_circuit_binop(env: Environment) -> Any:
+				lhs_value = lhs(env)
+				if lhs_value is short_circuit_value:
+					return lhs_value
+				return call_method([lhs_value, rhs(env)])
+
+			return short_circuit_binop
+
+		def binop(env: Environment) -> Any:
+			return call_method([lhs(env), rhs(env)])
+
+		return binop
+
+	def _store(self, name: str, scope: Optional[Scope]) -> StoreFunc:
+		if scope is not None and name in scope.slots:
+			index = scope.slots[name]
+
+			def store_slot(env: Environment, value: Any) -> None:
+				if env.scope is scope:
+					env.slots[index] = value
+				else:
+					env.state[name] = value
+
+			return store_slot
+
+		def store(env: Environment, value: Any) -> None:
+			env.state[name] = value
+
+		return store
+
+	def _compile_assign(self, target: Expr, value_expr: Expr, scope: Optional[Scope]) -> CompiledExpr:
+		if not isinstance(target, IdentExpr):
+			return _failure(f'can only assign to idents: {target.render()}')
+
+		store = self._store(target.value, scope)
+		value_code = self.compile(value_expr, scope)
+
+		def assign(env: Environment) -> Any:
+			value = value_code(env)
+			store(env, value)
+			return value
+
+		return assign
+
+	def _compile_access(self, expr: BinaryOpExpr, scope: Optional[Scope]) -> CompiledExpr:
+		if not isinstance(expr.rhs, IdentExpr):
+			return _failure(f'can only access idents: {expr.render()}')
+
+		name = expr.rhs.value
+		lhs = self.compile(expr.lhs, scope)
+
+		def access(env: Environment) -> Any:
+			lib = lhs(env)
+			if not isinstance(lib, Library):
+				raise QryRuntimeError(f'not a library: {expr.lhs.render()}')
+			return _find_in_library(lib, name)
+
+		return access
+
+	def _compile_UnaryOpExpr(self, expr: UnaryOpExpr, scope: Optional[Scope]) -> CompiledExpr:
+		arg = self.compile(expr.arg, scope)
+		call_method = MethodCallSite(ops.unop_lookup[expr.op]).call
+
+		def unop(env: Environment) -> Any:
+			return call_method([arg(env)])
+
+		return unop
+
+	def _compile_BoolLiteral(self, expr: BoolLiteral, scope: Optional[Scope]) -> CompiledExpr:
+		return _constant(expr.value)
+
+	def _compile_IntLiteral(self, expr: IntLiteral, scope: Optional[Scope]) -> CompiledExpr:
+		return _constant(expr.value)
+
+	def _compile_FloatLiteral(self, expr: FloatLiteral, scope: Optional[Scope]) -> CompiledExpr:
+		return _constant(expr.value)
+
+	def _compile_StringLiteral(self, expr: StringLiteral, scope: Optional[Scope]) -> CompiledExpr:
+		return _constant(expr.value)
+
+	def _compile_NullLiteral(self, expr: NullLiteral, scope: Optional[Scope]) -> CompiledExpr:
+		return _constant(null)
+
+	def _compile_IdentExpr(self, expr: IdentExpr, scope: Optional[Scope]) -> CompiledExpr:
+		name = expr.value
+		resolved = scope.resolve(name) if scope else None
+
+		if resolved is None:
+
+			def ident(env: Environment) -> Any:
+				return env.lookup(name)
+
+			return ident
+
+		depth, owner = resolved
+		index = owner.slots[name]
+
+		# the scope checks guard against envs that don't match the layout we compiled against,
+		# in which case we fall back to a lookup by name
+		if depth == 0:
+
+			def local_ident(env: Environment) -> Any:
+				if env.scope is owner:
+					value = env.slots[index]
+					if value is not unbound:
+						return value
+				return env.lookup(name)
+
+			return local_ident
+
+		def enclosing_ident(env: Environment) -> Any:
+			frame: Optional[Environment] = env
+			for _ in range(depth):
+				frame = frame.parent if frame else None
+
+			if frame and frame.scope is owner:
+				value = frame.slots[index]
+				if value is not unbound:
+					return value
+			return env.lookup(name)
+
+		return enclosing_ident
+
+	def _compile_FuncExpr(self, expr: FuncExpr, scope: Optional[Scope]) -> CompiledExpr:
+		arg_types = [(name, self.compile(type_expr, scope)) for name, type_expr in expr.args.items()]
+		return_type = self.compile(expr.return_type, scope)
+		store = self._store(expr.name, scope) if expr.name is not None else None
+
+		body_scope = _function_scope(expr, scope)
+		for e in expr.body:
+			self.compile(e, body_scope)
+
+		def func(env: Environment) -> Any:
+			args = []
+			for name, type_code in arg_types:
+				arg_type = type_code(env)
+				args.append(Argument(name, arg_type, arg_type is not Expr, ArgumentMode.STANDARD, False))
+
+			ret = Function(args, return_type(env), expr.body, env, body_scope)
+			if store:
+				store(env, ret)
+			return ret
+
+		return func
+
+	def _compile_CallExpr(self, expr: CallExpr, scope: Optional[Scope]) -> CompiledExpr:
+		func = self.compile(expr.func, scope)
+		positional = [(e, self.compile(e, scope)) for e in expr.positional_args]
+		named = {name: (e, self.compile(e, scope)) for name, e in expr.named_args.items()}
+
+		# call sites are nearly always monomorphic, so keep the plan for the last target we saw
+		site: List[Any] = [None, None]
+
+		def call(env: Environment) -> Any:
+			target = func(env)
+			if target is not site[0]:
+				site[1] = self._plan_call(target, positional, named)
+				site[0] = target
+			return site[1](env)
+
+		return call
+
+	def _plan_call(
+		self,
+		target: Any,
+		positional: List[Tuple[Expr, CompiledExpr]],
+		named: Dict[str, Tuple[Expr, CompiledExpr]],
+	) -> CompiledExpr:
+		method = None
+		if isinstance(target, Method):
+			method = target
+			target = method.default_func
+
+		if isinstance(target, Function):
+			return self._plan_function_call(target, positional)
+		elif isinstance(target, BuiltinFunction):
+			return self._plan_builtin_call(target, method, positional, named)
+
+		return _failure(f'invalid function: {target}')
+
+	def _plan_function_call(self, target: Function, positional: List[Tuple[Expr, CompiledExpr]]) -> CompiledExpr:
+		bindings = [(arg.name, arg.eval_immediate, e, code) for arg, (e, code) in zip(target.args, positional)]
+		body = [self.compile(e, target.scope) for e in target.body]
+		closure_env = target.environment
+		scope = target.scope
+
+		def run_body(func_env: Environment) -> Any:
+			ret = None
+			for body_code in body:
+				ret = body_code(func_env)
+			return ret
+
+		if scope is None:
+
+			def call_function(env: Environment) -> Any:
+				func_env = closure_env.child_env('exec')
+				state = func_env.state
+				for name, eval_immediate, e, code in bindings:
+					state[name] = code(env) if eval_immediate else e
+				return run_body(func_env)
+
+			return call_function
+
+		slot_bindings = [(scope.slots[name], eval_immediate, e, code) for name, eval_immediate, e, code in bindings]
+
+		def call_scoped_function(env: Environment) -> Any:
+			func_env = closure_env.frame_env('exec', scope)
+			slots = func_env.slots
+			for index, eval_immediate, e, code in slot_bindings:
+				slots[index] = code(env) if eval_immediate else e
+			return run_body(func_env)
+
+		return call_scoped_function
+
+	def _arg_getter(self, arg: Argument, e: Expr, code: CompiledExpr) -> CompiledExpr:
+		if not arg.eval_immediate:
+			return _constant(e)
+		elif arg.convert_to_py:
+			return lambda env: to_py(code(env))
+		return code
+
+	def _plan_builtin_call(
+		self,
+		target: BuiltinFunction,
+		method: Optional[Method],
+		positional: List[Tuple[Expr, CompiledExpr]],
+		named: Dict[str, Tuple[Expr, CompiledExpr]],
+	) -> CompiledExpr:
+		func_args = target.args
+		getters: List[CompiledExpr] = []
+		type_getters: List[CompiledExpr] = []
+		kwarg_getters: Dict[str, CompiledExpr] = {}
+
+		if target.implicit_caller_env:
+			getters.append(lambda env: env)
+
+		for i, (e, code) in enumerate(positional):
+			if i >= len(func_args):
+				return _failure(f'too many arguments: expected at most {len(func_args)}, got {len(positional)}')
+
+			arg = func_args[i]
+			if arg.mode == ArgumentMode.VARARGS:
+				getters.extend(self._arg_getter(arg, vararg, vararg_code) for vararg, vararg_code in positional[i:])
+				break
+			elif arg.mode == ArgumentMode.TYPEPARAM:
+				type_getters.append(self._arg_getter(arg, e, code))
+			else:
+				getters.append(self._arg_getter(arg, e, code))
+
+		# named args bind to standard args not already given positionally, and anything else goes to **kwargs
+		kwargs_arg = func_args[-1] if func_args and func_args[-1].mode == ArgumentMode.KWARGS else None
+		named_targets = {
+			arg.name: arg
+			for arg in func_args[len(positional):]
+			if arg.mode == ArgumentMode.STANDARD
+		}
+		for name, (e, code) in named.items():
+			named_arg = named_targets.get(name, kwargs_arg)
+			if named_arg is None:
+				if any(a.name == name for a in func_args):
+					return _failure(f'multiple values for argument: {name}')
+				return _failure(f'unknown argument: {name}')
+			kwarg_getters[name] = self._arg_getter(named_arg, e, code)
+
+		if method:
+			if named:
+				return _failure('methods only take positional arguments')
+
+			call_method = MethodCallSite(method).call
+
+			def call_builtin_method(env: Environment) -> Any:
+				args = [g(env) for g in getters]
+				return from_py(call_method(args, type_params = [g(env) for g in type_getters]))
+
+			return call_builtin_method
+
+		func = target.func
+		if kwarg_getters:
+
+			def call_builtin_kwargs(env: Environment) -> Any:
+				args = [g(env) for g in getters]
+				kwargs = {name: g(env) for name, g in kwarg_getters.items()}
+				return from_py(func(*args, **kwargs))
+
+			return call_builtin_kwargs
+
+		def call_builtin(env: Environment) -> Any:
+			return from_py(func(*[g(env) for g in getters]))
+
+		return call_builtin
+
+	def _compile_InterpolateExpr(self, expr: InterpolateExpr, scope: Optional[Scope]) -> CompiledExpr:
+		return self.compile(expr.contents, scope)
+
+	def _compile_UseExpr(self, expr: UseExpr, scope: Optional[Scope]) -> CompiledExpr:
+		def use(env: Environment) -> Any:
+			lib_env = env.interpreter_hooks.library_env
+			for lib_ident in expr.libs:
+				lib = lib_env.state[lib_ident]
+				assert isinstance(lib, Library)
+				lib_env = lib.environment
+
+			imports = lib_env.state.keys() if isinstance(expr.imports, UseWildcard) else expr.imports
+			for ident in imports:
+				env.state[ident] = lib_env.state[ident]
+
+		return use
@@ -1,3 +1,5 @@
+from .ast_cache import *
 from .coretypes import *
+from .optimiser import *
 from .parser import *
 from .syntax import *
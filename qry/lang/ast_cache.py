@@ -0,0 +1,92 @@
+from typing import Any, List, Optional
+from types import ModuleType
+from pathlib import Path
+import hashlib
+import sys
+
+from qry.common import get_cache_dir, get_original_module, read_cache_file, write_cache_file
+
+from . import coretypes, optimiser, parser, syntax
+from .optimiser import Optimiser
+from .parser import Parser, grammar_key
+from .syntax import Expr
+
+_default_cache_dir = object()
+
+def _code_fingerprint(modules: List[ModuleType]) -> str:
+	# cached ASTs are pickled syntax nodes, so any change to the code producing them makes them stale
+	h = hashlib.sha256()
+	for module in modules:
+		try:
+			h.update(Path(str(module.__file__)).read_bytes())
+		except OSError:
+			# frozen builds have no sources to hash, but their code only changes along with the executable
+			stat = Path(sys.executable).stat()
+			h.update(f'{sys.executable}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+	return h.hexdigest()
+
+# parses scripts through a cache of pickled ASTs keyed on the script contents
+# entries are additionally keyed on the grammar, the python version and the parser and optimiser code,
+# so anything that could change the resulting AST invalidates them
+class ASTCache:
+	parser: Parser
+	optimiser: Optional[Optimiser]
+	cache_dir: Optional[Path]
+	_fingerprint: Optional[str] = None
+
+	def __init__(
+		self,
+		parser: Parser,
+		optimiser: Optional[Optimiser] = None,
+		cache_dir: Any = _default_cache_dir,
+	) -> None:
+		self.parser = parser
+		self.optimiser = optimiser
+		self.cache_dir = get_cache_dir() if cache_dir is _default_cache_dir else cache_dir
+
+	def _key(self, text: str) -> str:
+		if self._fingerprint is None:
+			modules = [coretypes, optimiser, parser, syntax]
+			if self.optimiser:
+				# folded values come from the op implementations, so those count too
+				op_methods = list(self.optimiser.binops.values()) + list(self.optimiser.unops.values())
+				op_modules = {get_original_module(m) for m in op_methods}
+				modules += sorted([m for m in op_modules if m], key = lambda m: m.__name__)
+			self._fingerprint = _code_fingerprint(modules)
+
+		key_source = '\n'.join([
+			self._fingerprint,
+			grammar_key(),
+			sys.version,
+			'optimised' if self.optimiser else 'parsed',
+			text,
+		])
+		return hashlib.sha256(key_source.encode()).hexdigest()
+
+	def _path(self, text: str) -> Optional[Path]:
+		if not self.cache_dir:
+			return None
+		return self.cache_dir / 'ast' / f'{self._key(text)}.ast'
+
+	# the same parsing and optimisation applies with or without the cache, e.g. for lines typed into the repl
+	def parse(self, text: str, cache: bool = True) -> List[Expr]:
+		path = self._path(text) if cache else None
+		if path:
+			exprs = read_cache_file(path)
+			if isinstance(exprs, list) and all(isinstance(e, Expr) for e in exprs):
+				return exprs
+
+		exprs = self.parser.parse(text)
+		if self.optimiser:
+			exprs = self.optimiser.optimise(exprs)
+
+		if path:
+			try:
+				write_cache_file(path, exprs)
+			except OSError:
+				pass
+
+		return exprs
+
+	def parse_file(self, path: Path) -> List[Expr]:
+		return self.parse(path.read_text())
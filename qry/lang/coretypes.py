@@ -1,27 +1,84 @@
+from typing import Any, Tuple, TypeVar, Type
 from dataclasses import dataclass
 
 from qry.common import export
 
+# scalars are immutable and slotted, so we can freely share instances
+# bools and null are singletons, and small ints are cached in the same range as CPython's
+
+T = TypeVar('T')
+
+def _new_scalar(cls: Type[T], val: Any) -> T:
+	obj = object.__new__(cls)
+	object.__setattr__(obj, 'val', val)
+	return obj
+
 @export
-@dataclass
+@dataclass(frozen = True, init = False)
 class Int:
+	__slots__ = ('val', )
 	val: int
 
+	def __new__(cls, val: int) -> 'Int':
+		if -5 <= val <= 256 and type(val) is int:
+			return _small_ints[val + 5]
+		return _new_scalar(cls, val)
+
+	def __reduce__(self) -> Tuple[Any, ...]:
+		return (type(self), (self.val, ))
+
+_small_ints = [_new_scalar(Int, v) for v in range(-5, 257)]
+
 @export
-@dataclass
+@dataclass(frozen = True, init = False)
 class Float:
+	__slots__ = ('val', )
 	val: float
 
+	def __new__(cls, val: float) -> 'Float':
+		return _new_scalar(cls, val)
+
+	def __reduce__(self) -> Tuple[Any, ...]:
+		return (type(self), (self.val, ))
+
 @export
-@dataclass
+@dataclass(frozen = True, init = False)
 class String:
+	__slots__ = ('val', )
 	val: str
 
+	def __new__(cls, val: str) -> 'String':
+		return _new_scalar(cls, val)
+
+	def __reduce__(self) -> Tuple[Any, ...]:
+		return (type(self), (self.val, ))
+
 @export
-@dataclass
+@dataclass(frozen = True, init = False)
 class Bool:
+	__slots__ = ('val', )
 	val: bool
 
+	def __new__(cls, val: bool) -> 'Bool':
+		return true if val else false
+
+	def __reduce__(self) -> Tuple[Any, ...]:
+		return (type(self), (self.val, ))
+
+true = _new_scalar(Bool, True)
+false = _new_scalar(Bool, False)
+
 @export
 class Null:
-	pass
+	__slots__ = ()
+
+	def __new__(cls) -> 'Null':
+		return null
+
+	def __repr__(self) -> str:
+		return 'Null()'
+
+	def __reduce__(self) -> Tuple[Any, ...]:
+		return (Null, ())
+
+null = object.__new__(Null)
@@ -0,0 +1,183 @@
+from typing import Any, List, Mapping, Optional, Set, cast
+from typing_extensions import Protocol
+
+from .coretypes import String, Int, Float, Bool
+from .syntax import *
+
+class FoldableMethod(Protocol):
+	def call(self, args: List[Any]) -> Any:
+		...
+
+_literal_types = {
+	Int: IntLiteral,
+	Float: FloatLiteral,
+	String: StringLiteral,
+	Bool: BoolLiteral,
+}
+
+def _literal_value(expr: Expr) -> Optional[Any]:
+	if isinstance(expr, (IntLiteral, FloatLiteral, StringLiteral, BoolLiteral)):
+		return expr.value
+	return None
+
+def _is_pipe_call(expr: Expr) -> bool:
+	return isinstance(expr, BinaryOpExpr) and expr.op == BinaryOp.PIPE and isinstance(expr.rhs, CallExpr)
+
+def _is_assignment(expr: Expr) -> bool:
+	return isinstance(expr, BinaryOpExpr) and expr.op in (BinaryOp.LASSIGN, BinaryOp.RASSIGN)
+
+class _ReadFinder:
+	reads: Set[str]
+	dynamic: bool
+
+	def __init__(self) -> None:
+		self.reads = set()
+		self.dynamic = False
+
+	def visit(self, expr: Expr) -> None:
+		if isinstance(expr, IdentExpr):
+			self.reads.add(expr.value)
+		elif isinstance(expr, BinaryOpExpr):
+			if expr.op == BinaryOp.LASSIGN:
+				self.visit(expr.rhs)
+			elif expr.op in (BinaryOp.RASSIGN, BinaryOp.ACCESS):
+				self.visit(expr.lhs)
+			else:
+				self.visit(expr.lhs)
+				self.visit(expr.rhs)
+		elif isinstance(expr, UnaryOpExpr):
+			self.visit(expr.arg)
+		elif isinstance(expr, CallExpr):
+			self.visit(expr.func)
+			for e in expr.positional_args + list(expr.named_args.values()):
+				self.visit(e)
+		elif isinstance(expr, FuncExpr):
+			for e in list(expr.args.values()) + [expr.return_type] + expr.body:
+				self.visit(e)
+		elif isinstance(expr, InterpolateExpr):
+			self.visit(expr.contents)
+		elif isinstance(expr, UseExpr):
+			self.dynamic = True
+
+# rewrites parsed expressions into cheaper equivalents; nodes are never modified in place
+# - pipes are desugared into plain calls, a whole chain at a time
+# - unary and binary ops over literals are folded by calling the given op methods
+# - assignments to function locals which are never read are replaced by their values
+# call arguments are left as parsed, since callees taking an Expr (get_ast, sql filters...) receive them unevaluated,
+# and which callee a call resolves to is only known at runtime
+class Optimiser:
+	binops: Mapping[BinaryOp, FoldableMethod]
+	unops: Mapping[UnaryOp, FoldableMethod]
+
+	def __init__(self, binops: Mapping[BinaryOp, FoldableMethod], unops: Mapping[UnaryOp, FoldableMethod]) -> None:
+		self.binops = binops
+		self.unops = unops
+
+	def optimise(self, exprs: List[Expr]) -> List[Expr]:
+		return [self.optimise_expr(e) for e in exprs]
+
+	def optimise_expr(self, expr: Expr) -> Expr:
+		optimise_func = getattr(self, f'_optimise_{type(expr).__name__}', None)
+		if optimise_func is None:
+			return expr
+		return optimise_func(expr) # type: ignore
+
+	def _fold(self, source: SourceInfo, method: Optional[FoldableMethod], args: List[Any]) -> Optional[Expr]:
+		if method is None or any(a is None for a in args):
+			return None
+
+		# anything that fails here should fail at runtime instead, so we leave it alone
+		try:
+			value = method.call(args)
+		except Exception:
+			return None
+
+		literal_type = _literal_types.get(type(value))
+		if not literal_type:
+			return None
+		return literal_type(source, value) # type: ignore
+
+	def _optimise_BinaryOpExpr(self, expr: BinaryOpExpr) -> Expr:
+		if _is_pipe_call(expr):
+			return self._desugar_pipe(expr)
+
+		lhs = self.optimise_expr(expr.lhs)
+		rhs = expr.rhs if expr.op == BinaryOp.ACCESS else self.optimise_expr(expr.rhs)
+
+		short_circuit_value = short_circuit_values.get(expr.op)
+		if short_circuit_value is not None and _literal_value(lhs) is short_circuit_value:
+			return lhs
+
+		folded = self._fold(expr.source, self.binops.get(expr.op), [_literal_value(lhs), _literal_value(rhs)])
+		if folded:
+			return folded
+
+		if lhs is expr.lhs and rhs is expr.rhs:
+			return expr
+		return BinaryOpExpr(expr.source, lhs, expr.op, rhs)
+
+	def _desugar_pipe(self, expr: BinaryOpExpr) -> CallExpr:
+		call = cast(CallExpr, expr.rhs)
+		lhs = self._desugar_pipe(cast(BinaryOpExpr, expr.lhs)) if _is_pipe_call(expr.lhs) else expr.lhs
+		return CallExpr(call.source, self.optimise_expr(call.func), [lhs] + call.positional_args, call.named_args)
+
+	def _optimise_UnaryOpExpr(self, expr: UnaryOpExpr) -> Expr:
+		arg = self.optimise_expr(expr.arg)
+
+		folded = self._fold(expr.source, self.unops.get(expr.op), [_literal_value(arg)])
+		if folded:
+			return folded
+
+		if arg is expr.arg:
+			return expr
+		return UnaryOpExpr(expr.source, expr.op, arg)
+
+	def _optimise_CallExpr(self, expr: CallExpr) -> Expr:
+		func = self.optimise_expr(expr.func)
+		if func is expr.func:
+			return expr
+		return CallExpr(expr.source, func, expr.positional_args, expr.named_args)
+
+	def _optimise_InterpolateExpr(self, expr: InterpolateExpr) -> Expr:
+		return InterpolateExpr(expr.source, self.optimise_expr(expr.contents))
+
+	def _optimise_FuncExpr(self, expr: FuncExpr) -> Expr:
+		args = {name: self.optimise_expr(e) for name, e in expr.args.items()}
+		body = self.optimise(expr.body)
+
+		finder = _ReadFinder()
+		for e in body:
+			finder.visit(e)
+
+		if not finder.dynamic:
+			body = self._eliminate_dead_stores(body, finder.reads)
+
+		return FuncExpr(expr.source, expr.name, args, self.optimise_expr(expr.return_type), body)
+
+	def _eliminate_dead_stores(self, body: List[Expr], reads: Set[str]) -> List[Expr]:
+		def strip(expr: Expr) -> Expr:
+			if not isinstance(expr, BinaryOpExpr) or not _is_assignment(expr):
+				return expr
+
+			target, value = (expr.lhs, expr.rhs) if expr.op == BinaryOp.LASSIGN else (expr.rhs, expr.lhs)
+			value = strip(value)
+			if isinstance(target, IdentExpr) and target.value not in reads:
+				return value
+
+			if expr.op == BinaryOp.LASSIGN:
+				return BinaryOpExpr(expr.source, target, expr.op, value)
+			return BinaryOpExpr(expr.source, value, expr.op, target)
+
+		ret = []
+		for index, e in enumerate(body):
+			stripped = strip(e)
+
+			# the last expr is the return value, so it always stays
+			is_last = index == len(body) - 1
+			is_pure = _literal_value(stripped) is not None or isinstance(stripped, NullLiteral)
+			if stripped is not e and is_pure and not is_last:
+				continue
+
+			ret.append(stripped)
+
+		return ret
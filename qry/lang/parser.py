@@ -1,8 +1,18 @@
-from typing import Any, Callable, Type, List, Dict, cast
+from typing import Any, Callable, Type, List, Dict, Optional, Tuple, cast
 from pathlib import Path
+from functools import lru_cache
+import hashlib
+import os
 import sys
 
-from lark import Lark, Transformer, v_args
+import lark
+from lark import Lark, Token, Transformer, Tree, v_args
+from lark.grammar import Rule
+from lark.lexer import TerminalDef
+from lark.parser_frontends import get_frontend
+from lark.parse_tree_builder import ParseTreeBuilder
+
+from qry.common import get_cache_dir, read_cache_file, write_cache_file
 
 from .coretypes import String, Int, Float, Bool
 from .syntax import *
@@ -64,8 +74,14 @@ class ASTBuilder(Transformer): # type: ignore
 	def ident_expr(self, children: List[Any], meta: Any) -> IdentExpr:
 		return IdentExpr(self._source_info(meta), children[0].value)
 
+	def start(self, children: List[Any], meta: Any) -> List[Expr]:
+		return children
+
+	def arg_def(self, children: List[Any], meta: Any) -> Tuple[str, Expr]:
+		return (children[0], children[1])
+
 	def args_def(self, children: List[Any], meta: Any) -> Dict[str, Expr]:
-		return {arg.children[0]: arg.children[1] for arg in children}
+		return {name: expr for name, expr in children}
 
 	def func_expr(self, children: List[Any], meta: Any) -> FuncExpr:
 		name = None
@@ -130,16 +146,171 @@ def _get_data_file(file: str) -> Path:
 
 	return base_path / Path(file)
 
-lark_parser = Lark.open(
-	_get_data_file('qry/lang/grammar.lark'),
-	parser = 'lalr',
-	propagate_positions = True,
-	debug = True,
-)
+_grammar_file = 'qry/lang/grammar.lark'
+# prebuilt tables shipped alongside frozen builds, see cli.spec
+_bundled_tables_file = 'qry/lang/grammar.tables'
+
+_lark_options: Dict[str, Any] = {
+	'parser': 'lalr',
+	'propagate_positions': True,
+}
+
+_lark_namespace = {
+	'Rule': Rule,
+	'TerminalDef': TerminalDef,
+}
+
+def _tables_key(grammar: str) -> str:
+	key_source = '\n'.join([grammar, lark.__version__, repr(sorted(_lark_options.items()))])
+	return hashlib.sha256(key_source.encode()).hexdigest()
+
+def _serialize_tables(parser: Lark, key: str) -> Dict[str, Any]:
+	data, memo = parser.memo_serialize([TerminalDef, Rule])
+	return {'key': key, 'data': data, 'memo': memo}
+
+def _read_tables(path: Path, key: str) -> Optional[Dict[str, Any]]:
+	tables = read_cache_file(path)
+	if not isinstance(tables, dict) or tables.get('key') != key:
+		return None
+	return tables
+
+class _LineMeta:
+	__slots__ = ('line', )
+
+	line: Optional[int]
+
+	def __init__(self) -> None:
+		self.line = None
+
+# lines holds the first line covered by each value currently on the parser stack, mirroring lark's propagate_positions
+# entries are dropped as soon as their value is consumed, and whatever is left is cleared after each parse
+def _inline_callbacks(
+	tree_builder: ParseTreeBuilder,
+	builder: ASTBuilder,
+	lines: Dict[int, int],
+) -> Dict[Rule, Callable[[List[Any]], Any]]:
+	# reductions happen one at a time, so every callback can share a single meta object
+	meta = _LineMeta()
+
+	def rule_callback(name: str) -> Callable[[List[Any]], Any]:
+		func = getattr(builder, name, None)
+		if func is None:
+			# lark's own repetition helper rules, whose children get spliced into the parent rule
+			return lambda children: Tree(name, children)
+		return lambda children: func(children, meta)
+
+	def track_lines(func: Callable[[List[Any]], Any]) -> Callable[[List[Any]], Any]:
+		def callback(children: List[Any]) -> Any:
+			line = None
+			for c in children:
+				c_line = c.line if isinstance(c, Token) else lines.pop(id(c), None)
+				if line is None:
+					line = c_line
+
+			meta.line = line
+			ret = func(children)
+			if line is not None:
+				lines[id(ret)] = line
+			return ret
+
+		return callback
+
+	callbacks = {}
+	for rule, wrapper_chain in tree_builder.rule_builders:
+		f = rule_callback(rule.alias or rule.origin.name)
+		for wrapper in wrapper_chain:
+			f = wrapper(f)
+		callbacks[rule] = track_lines(f)
+
+	return callbacks
+
+class _InlineLark(Lark): # type: ignore
+	# runs the given ASTBuilder during LALR reductions instead of building a parse tree to transform afterwards
+	# lark can't hand meta to callbacks itself, so this replaces its own _prepare_callbacks
+	def _prepare_callbacks(self) -> None:
+		self.parser_class = get_frontend(self.options.parser, self.options.lexer)
+		self._parse_tree_builder = ParseTreeBuilder(self.rules, Tree, keep_all_tokens = self.options.keep_all_tokens)
+		self._lines: Dict[int, int] = {}
+		self._callbacks = _inline_callbacks(self._parse_tree_builder, self.options.transformer, self._lines)
+
+	def parse(self, text: str, *args: Any, **kwargs: Any) -> Any:
+		try:
+			return super().parse(text, *args, **kwargs)
+		finally:
+			# the start rule's result is never consumed, and a failed parse leaves values on the stack,
+			# so without this their ids could later be reused by new nodes and pick up stale lines
+			self._lines.clear()
+
+@lru_cache(maxsize = None)
+def _read_grammar() -> str:
+	return _get_data_file(_grammar_file).read_text()
+
+# identifies the grammar and parser options, for anything caching parser output
+@lru_cache(maxsize = None)
+def grammar_key() -> str:
+	return _tables_key(_read_grammar())
+
+def write_parser_tables(path: Path) -> None:
+	write_cache_file(path, _serialize_tables(Lark(_read_grammar(), **_lark_options), grammar_key()))
+
+def _load_parser_tables() -> Dict[str, Any]:
+	grammar = _read_grammar()
+	key = grammar_key()
+
+	# debug builds from scratch every time, so that grammar conflicts are always reported
+	if os.getenv('QRY_PARSER_DEBUG'):
+		return _serialize_tables(Lark(grammar, debug = True, **_lark_options), key)
+
+	cache_dir = get_cache_dir()
+	cache_path = cache_dir / f'parser-{key}.tables' if cache_dir else None
+
+	for path in [_get_data_file(_bundled_tables_file), cache_path]:
+		tables = _read_tables(path, key) if path else None
+		if tables:
+			return tables
+
+	tables = _serialize_tables(Lark(grammar, **_lark_options), key)
+	if cache_path:
+		try:
+			write_cache_file(cache_path, tables)
+		except OSError:
+			pass
+
+	return tables
+
+_parser_tables: Optional[Dict[str, Any]] = None
+_lark_parsers: Dict[bool, Lark] = {}
+
+def _get_lark_parser(build_tree: bool) -> Lark:
+	global _parser_tables
+
+	parser = _lark_parsers.get(build_tree)
+	if parser is None:
+		if _parser_tables is None:
+			_parser_tables = _load_parser_tables()
+
+		lark_class = Lark if build_tree else _InlineLark
+		transformer = None if build_tree else ASTBuilder()
+		parser = lark_class.deserialize(
+			_parser_tables['data'],
+			_lark_namespace,
+			_parser_tables['memo'],
+			transformer = transformer,
+		)
+		_lark_parsers[build_tree] = parser
+
+	return parser
 
 class Parser:
 	_builder = ASTBuilder()
 
+	# build_tree parses into a full lark tree first and transforms it afterwards, which is slower and
+	# holds the whole tree in memory, but is handy when debugging the grammar
+	def __init__(self, build_tree: bool = False) -> None:
+		self.build_tree = build_tree
+
 	def parse(self, text: str) -> List[Expr]:
-		tree = lark_parser.parse(text)
-		return cast(List[Expr], self._builder.transform(tree).children)
+		parser = _get_lark_parser(self.build_tree)
+		if self.build_tree:
+			return cast(List[Expr], self._builder.transform(parser.parse(text)))
+		return cast(List[Expr], parser.parse(text))
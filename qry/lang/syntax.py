@@ -1,9 +1,9 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from abc import ABC, abstractmethod
-from typing import List, Dict, Optional, Union
+from typing import Any, Callable, List, Dict, Optional, Union
 
-from .coretypes import String, Int, Float, Bool
+from .coretypes import String, Int, Float, Bool, true, false
 
 @dataclass
 class SourceInfo:
@@ -12,6 +12,8 @@ class SourceInfo:
 @dataclass # type: ignore
 class Expr(ABC):
 	source: SourceInfo
+	# populated by the interpreter the first time this node is evaluated
+	compiled: Optional[Callable[[Any], Any]] = field(default = None, init = False, repr = False, compare = False)
 
 	@abstractmethod
 	def render(self) -> str:
@@ -37,10 +39,19 @@ class BinaryOp(Enum):
 
 	PIPE = '|>'
 
-	# TODO: short-circuiting variants
 	AND = "&"
 	OR = "|"
 
+	# only evaluate the rhs if the lhs doesn't already decide the result
+	LOGICAL_AND = "&&"
+	LOGICAL_OR = "||"
+
+# lhs values which decide the result of a logical op by themselves
+short_circuit_values = {
+	BinaryOp.LOGICAL_AND: false,
+	BinaryOp.LOGICAL_OR: true,
+}
+
 _binary_ops_without_spaces = {
 	BinaryOp.ACCESS,
 }
@@ -143,6 +154,7 @@ class InterpolateExpr(Expr):
 	def render(self) -> str:
 		return f'{{{{{self.contents.render()}}}}}'
 
+@dataclass
 class UseWildcard:
 	pass
 
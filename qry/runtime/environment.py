@@ -1,14 +1,36 @@
-from typing import Any, Dict, Optional, List
-from dataclasses import dataclass
+from typing import Any, Dict, Optional, List, Tuple, Iterator
+from dataclasses import dataclass, field
 
 from qry.lang import Expr
 
+from .error import QryRuntimeError
+
+# marks a slot whose local hasn't been assigned yet; lookups fall through to the parent env
+unbound = object()
+
+@dataclass
+class Scope:
+	slots: Dict[str, int]
+	parent: Optional['Scope'] = None
+
+	def resolve(self, name: str) -> Optional[Tuple[int, 'Scope']]:
+		depth = 0
+		scope: Optional[Scope] = self
+		while scope:
+			if name in scope.slots:
+				return depth, scope
+			scope = scope.parent
+			depth += 1
+		return None
+
 @dataclass
 class Environment:
 	name: str
 	state: Dict[str, Any]
 	interpreter_hooks: Any # TODO: move interpreter eval logic into runtime?
 	parent: Optional['Environment'] = None
+	scope: Optional[Scope] = None
+	slots: List[Any] = field(default_factory = list)
 
 	def chain(self) -> List['Environment']:
 		ret = []
@@ -19,8 +41,33 @@ class Environment:
 		return ret
 
 	def child_env(self, name: str) -> 'Environment':
-		child_state = self.state.copy()
-		return Environment(name, child_state, self.interpreter_hooks, self)
+		return Environment(name, {}, self.interpreter_hooks, self)
+
+	def frame_env(self, name: str, scope: Scope) -> 'Environment':
+		return Environment(name, {}, self.interpreter_hooks, self, scope, [unbound] * len(scope.slots))
+
+	def lookup(self, name: str) -> Any:
+		env: Optional[Environment] = self
+		while env:
+			if env.scope is not None:
+				index = env.scope.slots.get(name)
+				if index is not None and env.slots[index] is not unbound:
+					return env.slots[index]
+
+			if name in env.state:
+				return env.state[name]
+
+			env = env.parent
+
+		raise QryRuntimeError(f'not found: {name}')
+
+	def local_items(self) -> Iterator[Tuple[str, Any]]:
+		if self.scope is not None:
+			for name, index in self.scope.slots.items():
+				if self.slots[index] is not unbound:
+					yield name, self.slots[index]
+
+		yield from self.state.items()
 
 	def eval(self, expr: Expr) -> Any:
 		return self.interpreter_hooks.eval_in_env(expr, self)
@@ -1,4 +1,4 @@
-from typing import List, Any, Callable
+from typing import List, Any, Callable, Optional
 from dataclasses import dataclass, field
 import inspect
 from enum import Enum, auto
@@ -6,7 +6,7 @@ from enum import Enum, auto
 from qry.lang import Expr
 
 from .runtime import py_to_qry_type, qry_to_py_type
-from .environment import Environment
+from .environment import Environment, Scope
 
 class TypeParam:
 	pass
@@ -34,6 +34,8 @@ class FunctionBase:
 class Function(FunctionBase):
 	body: List[Expr]
 	environment: Environment
+	# slot layout for locals when they were resolved at compile time
+	scope: Optional[Scope] = None
 
 def _py_arg(arg_spec: inspect.FullArgSpec, name: str) -> Argument:
 	annotated_type = arg_spec.annotations[name]
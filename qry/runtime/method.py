@@ -1,4 +1,4 @@
-from typing import List, Any, Dict, Callable, Tuple
+from typing import List, Any, Dict, Callable, Tuple, Sequence
 from dataclasses import dataclass, field
 from inspect import getmodule
 
@@ -8,22 +8,31 @@ from .runtime import py_to_qry_type
 from .function import BuiltinFunction
 from .error import QryRuntimeError
 
-def _method_sig(types: List[type]) -> str:
+MethodKey = Tuple[type, ...]
+
+def _method_key(types: Sequence[type]) -> MethodKey:
 	if Any in types:
 		raise QryRuntimeError(f'tried to create a method signature including {Any}')
 
-	return '|'.join([t.__name__ for t in types])
+	return tuple(types)
+
+def _method_sig(key: MethodKey) -> str:
+	return '|'.join([t.__name__ for t in key])
 
 @dataclass
 class Method:
 	name: str
 	default_func: BuiltinFunction
-	funcs: Dict[str, BuiltinFunction] = field(default_factory = dict)
+	funcs: Dict[MethodKey, BuiltinFunction] = field(default_factory = dict)
+	# bumped whenever resolution results may have changed, so call sites know to drop their caches
+	version: int = 0
+	_resolved: Dict[MethodKey, Tuple[str, BuiltinFunction]] = field(default_factory = dict, repr = False)
 
 	def _register(self, impl_func: Callable[..., Any], type_params: List[type]) -> Callable[..., Any]:
 		func_obj = BuiltinFunction.from_func(impl_func)
 		args = type_params + [a.type for a in func_obj.args]
-		self.funcs[_method_sig(args)] = func_obj
+		self.funcs[_method_key(args)] = func_obj
+		self.invalidate()
 		return impl_func
 
 	def __call__(self, impl_func: Callable[..., Any]) -> Callable[..., Any]:
@@ -35,34 +44,81 @@ class Method:
 
 		return wrapper
 
+	def invalidate(self) -> None:
+		self._resolved.clear()
+		self.version += 1
+
+	def signatures(self) -> List[str]:
+		return [_method_sig(k) for k in self.funcs.keys()]
+
+	def resolve_key(self, key: MethodKey) -> Tuple[str, BuiltinFunction]:
+		ret = self._resolved.get(key)
+		if ret is None:
+			qry_key = _method_key([py_to_qry_type(t) for t in key])
+			ret = _method_sig(qry_key), self.funcs.get(qry_key, self.default_func)
+			self._resolved[key] = ret
+		return ret
+
 	def resolve(
 		self,
 		arg_types: List[type],
 		type_params: List[type] = [],
 		allow_default: bool = True,
 	) -> Tuple[str, BuiltinFunction]:
-		sig = _method_sig(type_params + [py_to_qry_type(a) for a in arg_types])
-		func = self.funcs.get(sig, self.default_func)
+		sig, func = self.resolve_key(tuple(type_params) + tuple(arg_types))
 
 		if not allow_default and func == self.default_func:
 			raise QryRuntimeError('default func disallowed')
 
 		return sig, func
 
-	def call(self, args: List[Any], type_params: List[type] = []) -> Any:
-		sig, func = self.resolve([type(a) for a in args], type_params)
-
+	def invoke(self, sig: str, func: BuiltinFunction, args: List[Any], type_params: List[type]) -> Any:
 		# supply unhandled types as actual args for fallback generic dispatch
-		if func == self.default_func and len(type_params):
+		if func is self.default_func and len(type_params):
 			ret = func.func(*(type_params + args))
 		else:
 			ret = func.func(*args)
 
-		if ret == NotImplemented:
+		if ret is NotImplemented:
 			raise QryRuntimeError(f'unimplemented method "{func.func.__name__}" for signature: {sig}')
 
 		return ret
 
+	def call(self, args: List[Any], type_params: List[type] = []) -> Any:
+		sig, func = self.resolve_key(tuple(type_params) + tuple([type(a) for a in args]))
+		return self.invoke(sig, func, args, type_params)
+
+class MethodCallSite:
+	# inline cache for a single call site, keyed on the concrete arg types seen there
+	# most sites only ever see one or two signatures, so we keep a handful before deferring to the method
+	__slots__ = ('method', 'limit', 'version', 'entries')
+
+	method: Method
+	limit: int
+	version: int
+	entries: Dict[MethodKey, Tuple[str, BuiltinFunction]]
+
+	def __init__(self, method: Method, limit: int = 4) -> None:
+		self.method = method
+		self.limit = limit
+		self.version = method.version
+		self.entries = {}
+
+	def call(self, args: List[Any], type_params: List[type] = []) -> Any:
+		method = self.method
+		if self.version != method.version:
+			self.entries = {}
+			self.version = method.version
+
+		key = tuple(type_params) + tuple([type(a) for a in args])
+		entry = self.entries.get(key)
+		if entry is None:
+			entry = method.resolve_key(key)
+			if len(self.entries) < self.limit:
+				self.entries[key] = entry
+
+		return method.invoke(entry[0], entry[1], args, type_params)
+
 def method(ref_func: Callable[..., Any]) -> Method:
 	meth = Method(ref_func.__name__, BuiltinFunction.from_func(ref_func))
 	setattr(meth, '__name__', ref_func.__name__)
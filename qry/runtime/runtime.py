@@ -1,7 +1,7 @@
-from typing import Any, Callable
-from dataclasses import dataclass
+from typing import Any, Callable, Optional
+from dataclasses import dataclass, field
 
-from qry.lang import String, Float, Int, Bool, Null
+from qry.lang import String, Float, Int, Bool, Null, null
 from qry.common import is_exported
 
 from .environment import Environment
@@ -10,7 +10,7 @@ from .error import QryRuntimeError
 def to_py(obj: Any) -> Any:
 	if isinstance(obj, (String, Int, Float, Bool)):
 		return obj.val
-	elif isinstance(obj, Null):
+	elif obj is null:
 		return None
 
 	return obj
@@ -21,11 +21,11 @@ class TypeTranslator:
 	translate_func: Callable[[Any], Any]
 
 _qry_type_map = {
-	str: TypeTranslator(String, lambda x: String(x)),
-	bool: TypeTranslator(Bool, lambda x: Bool(x)),
-	int: TypeTranslator(Int, lambda x: Int(x)),
-	float: TypeTranslator(Float, lambda x: Float(x)),
-	type(None): TypeTranslator(Null, lambda _: Null()),
+	str: TypeTranslator(String, String),
+	bool: TypeTranslator(Bool, Bool),
+	int: TypeTranslator(Int, Int),
+	float: TypeTranslator(Float, Float),
+	type(None): TypeTranslator(Null, lambda _: null),
 }
 
 _py_type_map = {translator.qry_type: py_type for py_type, translator in _qry_type_map.items()}
@@ -41,15 +41,29 @@ def qry_to_py_type(qry_type: type) -> type:
 	return _py_type_map.get(qry_type, qry_type)
 
 def from_py(obj: Any) -> Any:
-	if is_exported(type(obj)):
-		return obj
-
 	translator = _qry_type_map.get(type(obj))
-	if not translator:
+	if translator:
+		return translator.translate_func(obj) # type: ignore
+
+	if not is_exported(type(obj)):
 		raise QryRuntimeError(f'returning unsupported type ({type(obj)}) to qry: {obj}')
 
-	return translator.translate_func(obj) # type: ignore
+	return obj
 
+# libraries are only built the first time something inside them is accessed,
+# so that unused ones don't cost anything (data in particular pulls in pyarrow and numpy)
 @dataclass
 class Library:
-	environment: Environment
+	name: str
+	loader: Callable[[], Environment] = field(repr = False)
+	_environment: Optional[Environment] = field(default = None, repr = False)
+
+	@property
+	def environment(self) -> Environment:
+		if self._environment is None:
+			self._environment = self.loader()
+		return self._environment
+
+	@property
+	def loaded(self) -> bool:
+		return self._environment is not None
@@ -1,6 +1,8 @@
 from .dataframe import *
+from .futures import *
 from .sql import *
 from .sql_codegen import *
+from .stream import *
 from .vector import *
 
 from .db_mysql import *
@@ -1,11 +1,12 @@
 from dataclasses import dataclass
-from typing import cast
+from typing import Any, cast
 from functools import reduce
 
 from pyarrow import Table, csv, array
 from numpy import concatenate
 
 from qry.common import export
+from qry.runtime import method
 from qry.stdlib.ops import to_string, num_cols, num_rows
 
 from .vector import Vector, vector_from_array
@@ -33,7 +34,12 @@ def df_num_rows(df: DataFrame) -> int:
 	return cast(int, df.table.num_rows)
 
 @export
-def col(df: DataFrame, name: str) -> Vector:
+@method
+def col(obj: Any, name: str) -> Any:
+	return NotImplemented
+
+@col
+def df_col(df: DataFrame, name: str) -> Vector:
 	# tables use chunked arrays, we want contiguous for vectors
 	# this is awful, maybe scrap table usage altogether and convert asap for csv etc
 	arr = [arr.to_numpy() for arr in df.table.column(name).chunks]
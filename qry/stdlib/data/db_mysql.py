@@ -1,21 +1,61 @@
-from typing import Optional
-
-from pymysql import connect, FIELD_TYPE
+from typing import Any, Iterable, List, Optional, Tuple
 
 from qry.common import export
 from qry.lang import String, Int, Float, Bool, BinaryOp
 
-from .sql_connection import Connection, SQLExpression
-from .sql import metadata_from_typecode_lookup
+from .sql_connection import Connection, DBConn, DBCursor, SQLExpression, QueryParams, pooled_connection
+from .sql import metadata_from_typecode_lookup, metadata_from_catalog
 
+# pymysql.FIELD_TYPE values, spelled out so the driver is only imported on connect
 _typecode_map = {
-	FIELD_TYPE.VAR_STRING: String,
-	FIELD_TYPE.VARCHAR: String,
-	FIELD_TYPE.STRING: String,
-	FIELD_TYPE.SHORT: Int,
-	FIELD_TYPE.LONG: Int,
+	253: String, # VAR_STRING
+	15: String, # VARCHAR
+	254: String, # STRING
+	252: String, # BLOB, which text columns are reported as too, and are told apart from by their charset
+	1: Int, # TINY
+	2: Int, # SHORT
+	3: Int, # LONG
+	8: Int, # LONGLONG
+	9: Int, # INT24
+	4: Float, # FLOAT
+	5: Float, # DOUBLE
+}
+
+_blob_typecode = 252
+_binary_charset = 63
+
+# binary blobs are reported as the same type as text, so they're given a typecode of their own which nothing maps
+# pymysql only has the charset of each column on its result's fields
+def _mysql_column_typecodes(cursor: DBCursor) -> Iterable[Tuple[str, Any]]:
+	ret: List[Tuple[str, Any]] = []
+	for field in cursor._result.fields: # type: ignore
+		binary = field.type_code == _blob_typecode and field.charsetnr == _binary_charset
+		ret.append((field.name, 'binary blob' if binary else field.type_code))
+	return ret
+
+# information_schema.columns.data_type names for the same types
+_catalog_type_map = {
+	'char': String,
+	'varchar': String,
+	'tinytext': String,
+	'text': String,
+	'mediumtext': String,
+	'longtext': String,
+	'tinyint': Int,
+	'smallint': Int,
+	'mediumint': Int,
+	'int': Int,
+	'bigint': Int,
+	'float': Float,
+	'double': Float,
 }
 
+_catalog_query = '''
+	select table_name, column_name, data_type from information_schema.columns
+	where table_schema = database()
+	order by table_name, ordinal_position
+'''
+
 def _mysql_binop_rewrite(
 	op: BinaryOp,
 	lhs: SQLExpression,
@@ -26,18 +66,56 @@ def _mysql_binop_rewrite(
 
 	return None
 
+def _mysql_server_cursor(conn: Connection) -> DBCursor:
+	import pymysql
+
+	return conn.c.cursor(pymysql.cursors.SSCursor)
+
+def _mysql_estimate_rows(conn: Connection, sql: str, params: QueryParams) -> Optional[int]:
+	cursor = conn.c.cursor()
+	try:
+		cursor.execute(f'explain {sql}', params)
+		rows_index = [desc[0] for desc in cursor.description].index('rows')
+		steps = cursor.fetchall()
+	finally:
+		cursor.close()
+
+	# subqueries show up as separate steps, and the largest of them bounds how much data is involved
+	estimates = [step[rows_index] for step in steps if step[rows_index] is not None]
+	return int(max(estimates)) if estimates else None
+
 @export
-def connect_mysql(host: str, port: int, database: str, user: str, password: str) -> Connection:
-	conn = Connection(
-		connect( # type: ignore
-		host = host,
-		port = port,
-		db = database,
-		user = user,
-		passwd = password,
-		),
-		metadata_from_typecode_lookup(_typecode_map),
-		_mysql_binop_rewrite)
-
-	conn.c.autocommit(True) # type: ignore
-	return conn
+def connect_mysql(
+	host: str,
+	port: int,
+	database: str,
+	user: str,
+	password: str,
+	server_cursor_threshold: int = -1,
+	pool_size: int = 0,
+) -> Connection:
+	import pymysql
+
+	def connect() -> DBConn:
+		c = pymysql.connect(
+			host = host,
+			port = port,
+			db = database,
+			user = user,
+			passwd = password,
+		)
+		c.autocommit(True)
+		return c # type: ignore
+
+	return pooled_connection(
+		('mysql', host, port, database, user, password),
+		connect,
+		pool_size,
+		metadata_from_typecode_lookup(_typecode_map, _mysql_column_typecodes),
+		get_all_table_metadata = metadata_from_catalog(_catalog_query, _catalog_type_map),
+		rewrite_binop = _mysql_binop_rewrite,
+		server_cursor = _mysql_server_cursor,
+		estimate_rows = _mysql_estimate_rows,
+		server_cursor_threshold = server_cursor_threshold,
+		placeholder = '%s',
+		column_type_names = {Int: 'bigint', Float: 'double', String: 'text', Bool: 'boolean'})
@@ -1,10 +1,18 @@
-import psycopg2
+from typing import Any, Optional, Dict, List, Tuple, Iterator
+from io import StringIO
+from uuid import uuid4
+from tempfile import SpooledTemporaryFile
+from weakref import WeakKeyDictionary
+
+import pyarrow
+from pyarrow import csv
 
 from qry.common import export
 from qry.lang import String, Int, Float, Bool
+from qry.runtime import py_to_qry_type
 
-from .sql_connection import Connection
-from .sql import metadata_from_typecode_lookup
+from .sql_connection import Connection, DBConn, DBCursor, QueryParams, pooled_connection
+from .sql import metadata_from_typecode_lookup, metadata_from_catalog, arrow_types
 
 _oid_map = {
 	# ints
@@ -12,21 +20,210 @@ _oid_map = {
 	21: Int, # int2
 	23: Int, # int4
 
+	# floats
+	700: Float, # float4
+	701: Float, # float8
+
 	# strings
 	25: String, # text
 	1042: String, # char
 	1043: String, # varchar
+
+	16: Bool, # bool
+}
+
+# information_schema.columns.data_type names for the same types
+_catalog_type_map = {
+	'bigint': Int,
+	'smallint': Int,
+	'integer': Int,
+	'real': Float,
+	'double precision': Float,
+	'text': String,
+	'character': String,
+	'character varying': String,
+	'boolean': Bool,
 }
 
+# tables in several schemas on the search path are only taken from the one their unqualified name resolves to
+_catalog_query = '''
+	select table_name, column_name, data_type from information_schema.columns
+	where table_schema = any(current_schemas(false))
+	and to_regclass(quote_ident(table_name)) = to_regclass(format('%I.%I', table_schema, table_name))
+	order by table_name, ordinal_position
+'''
+
+def _postgres_server_cursor(conn: Connection) -> DBCursor:
+	# named cursors live in a transaction unless they're held, and we run in autocommit
+	return conn.c.cursor(name = f'qry_{uuid4().hex}', withhold = True) # type: ignore
+
+def _postgres_estimate_rows(conn: Connection, sql: str, params: QueryParams) -> Optional[int]:
+	cursor = conn.c.cursor()
+	try:
+		cursor.execute(f'explain (format json) {sql}', params)
+		plan = cursor.fetchall()[0][0]
+	finally:
+		cursor.close()
+
+	return int(plan[0]['Plan']['Plan Rows'])
+
+# COPY output is held in memory up to this size, and spills to a temp file past it
+_copy_spool_size = 64 * 2 ** 20
+
+def _postgres_copy_fetch(
+	conn: Connection,
+	sql: str,
+	params: QueryParams,
+	columns: Dict[str, type],
+) -> Optional[pyarrow.Table]:
+	# every column needs a type we can parse the csv into, otherwise the cursor path decides the types
+	# only what's decided before the query runs can fall back to it, so nothing is ever run twice
+	column_types = {}
+	for name, t in columns.items():
+		arrow_type = arrow_types.get(t)
+		if arrow_type is None:
+			return None
+
+		# unquoted names come back lowercased
+		column_types[name] = arrow_type
+		column_types[name.lower()] = arrow_type
+
+	# a marker no string value can be mistaken for, unlike copy's usual \\N
+	null_marker = f'qry_null_{uuid4().hex}'
+
+	def convert_options(column_types: Dict[str, pyarrow.DataType]) -> csv.ConvertOptions:
+		return csv.ConvertOptions(
+			column_types = column_types,
+			null_values = [null_marker],
+			strings_can_be_null = True,
+			true_values = ['t'],
+			false_values = ['f'],
+		)
+
+	with SpooledTemporaryFile(max_size = _copy_spool_size) as f:
+		cursor = conn.c.cursor()
+		try:
+			# copy can't take parameters, so they're bound on our side
+			try:
+				query = cursor.mogrify(sql, params).decode() # type: ignore
+			except Exception:
+				return None
+
+			copy_sql = f"copy ({query}) to stdout with (format csv, header, null '{null_marker}')"
+			cursor.copy_expert(copy_sql, f) # type: ignore
+		finally:
+			cursor.close()
+
+		# values that don't fit the types we expected get their types inferred, as they would from a cursor
+		try:
+			f.seek(0)
+			return csv.read_csv(f, convert_options = convert_options(column_types))
+		except pyarrow.ArrowInvalid:
+			f.seek(0)
+			return csv.read_csv(f, convert_options = convert_options({}))
+
+# statements already prepared on each db connection, keyed by their sql and parameter types
+_prepared_statements: 'WeakKeyDictionary[Any, Dict[Tuple[str, Tuple[type, ...]], Optional[str]]]' = WeakKeyDictionary()
+# past this many, a connection's statements are all deallocated rather than piling up
+_max_prepared_statements = 256
+
+def _postgres_execute_prepared(conn: Connection, cursor: DBCursor, sql: str, params: QueryParams) -> None:
+	# named cursors are declared over a query, which an execute isn't
+	if getattr(cursor, 'name', None) is not None:
+		cursor.execute(sql, params)
+		return
+
+	names = list(params.keys())
+	types = tuple([py_to_qry_type(type(params[n])) for n in names])
+	statements = _prepared_statements.setdefault(conn.c, {})
+
+	key = (sql, types)
+	if key not in statements:
+		if len(statements) >= _max_prepared_statements:
+			cursor.execute('deallocate all')
+			statements.clear()
+
+		statement: Optional[str] = f'qry_{uuid4().hex}'
+		type_names = ', '.join([conn.column_type_names[t] for t in types])
+		# named placeholders become positional ones, and doubled up %s go back to single ones
+		positional_sql = sql % {n: f'${index + 1}' for index, n in enumerate(names)}
+		try:
+			cursor.execute(f'prepare {statement} ({type_names}) as {positional_sql}')
+		except Exception:
+			# anything we fail to prepare still runs fine as a plain query
+			statement = None
+		statements[key] = statement
+
+	statement = statements[key]
+	if statement is None:
+		cursor.execute(sql, params)
+		return
+
+	markers = ', '.join([f'%({n})s' for n in names])
+	cursor.execute(f'execute {statement} ({markers})', params)
+
+_copy_text_escapes = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+# a value in copy's text format, where \\N is null and only strings need escaping
+def _copy_text_value(value: Any) -> str:
+	if value is None:
+		return '\\N'
+	if isinstance(value, bool):
+		return 't' if value else 'f'
+	if isinstance(value, str):
+		return value.translate(_copy_text_escapes)
+	return str(value)
+
+def _postgres_copy_insert(
+	conn: Connection,
+	table: str,
+	names: List[str],
+	batches: Iterator[List[Tuple[Any, ...]]],
+) -> None:
+	sql = f'copy {table} ({", ".join(names)}) from stdin'
+	cursor = conn.c.cursor()
+	for rows in batches:
+		buffer = StringIO()
+		for row in rows:
+			buffer.write('\t'.join([_copy_text_value(v) for v in row]))
+			buffer.write('\n')
+		buffer.seek(0)
+		cursor.copy_expert(sql, buffer) # type: ignore
+
 @export
-def connect_postgres(host: str, port: int, database: str, user: str, password: str) -> Connection:
-	conn = Connection(psycopg2.connect(
-		host = host,
-		port = port,
-		dbname = database,
-		user = user,
-		password = password,
-	), metadata_from_typecode_lookup(_oid_map))
-
-	conn.c.autocommit = True # type: ignore
-	return conn
+def connect_postgres(
+	host: str,
+	port: int,
+	database: str,
+	user: str,
+	password: str,
+	server_cursor_threshold: int = -1,
+	copy_export: bool = False,
+	pool_size: int = 0,
+) -> Connection:
+	import psycopg2
+
+	def connect() -> DBConn:
+		c = psycopg2.connect(
+			host = host,
+			port = port,
+			dbname = database,
+			user = user,
+			password = password,
+		)
+		c.autocommit = True
+		return c # type: ignore
+
+	return pooled_connection(
+		('postgres', host, port, database, user, password),
+		connect,
+		pool_size,
+		metadata_from_typecode_lookup(_oid_map),
+		get_all_table_metadata = metadata_from_catalog(_catalog_query, _catalog_type_map),
+		server_cursor = _postgres_server_cursor,
+		estimate_rows = _postgres_estimate_rows,
+		server_cursor_threshold = server_cursor_threshold,
+		bulk_fetch = _postgres_copy_fetch if copy_export else None,
+		placeholder = '%s',
+		execute_prepared = _postgres_execute_prepared,
+		bulk_insert = _postgres_copy_insert)
@@ -1,18 +1,32 @@
-from typing import Dict
-
-import sqlite3
+from typing import Dict, Optional, cast
 
 from qry.common import export
 from qry.lang import String, Int, Float, Bool
 
-from .sql_connection import Connection
+from .sql_connection import Connection, DBConn, pooled_connection
+from .sql import catalog_metadata
 
 _affinity_map = {
 	'text': String,
 	'integer': Int,
+	'real': Float,
 }
 
-def _sqlite_metadata(conn: Connection, table: str) -> Dict[str, type]:
+# sqlite's rules for deriving a column's affinity from its declared type
+def _declared_affinity(declared: str) -> Optional[type]:
+	declared = declared.upper()
+	# sqlite stores bools as 0 and 1, so the declared type is all that tells them apart from ints
+	if 'BOOL' in declared:
+		return Bool
+	if 'INT' in declared:
+		return Int
+	if any(t in declared for t in ('CHAR', 'CLOB', 'TEXT')):
+		return String
+	if any(t in declared for t in ('REAL', 'FLOA', 'DOUB')):
+		return Float
+	return None
+
+def _sqlite_value_metadata(conn: Connection, table: str) -> Dict[str, type]:
 	cursor = conn.c.cursor()
 	# FIXME: injection
 	cursor.execute(f'select * from {table} limit 0')
@@ -30,6 +44,41 @@ def _sqlite_metadata(conn: Connection, table: str) -> Dict[str, type]:
 
 	return ret
 
+# columns without a usable declared type fall back to the types of the values in the first row
+def _sqlite_metadata(conn: Connection, table: str) -> Dict[str, type]:
+	cursor = conn.c.cursor()
+	cursor.execute('select name, type from pragma_table_info(?)', (table, ))
+	types = {name: _declared_affinity(declared) for name, declared in cursor.fetchall()}
+	if not types or None in types.values():
+		return _sqlite_value_metadata(conn, table)
+
+	return cast(Dict[str, type], types)
+
+def _sqlite_all_metadata(conn: Connection) -> Dict[str, Dict[str, type]]:
+	cursor = conn.c.cursor()
+	cursor.execute('''
+		select m.name, p.name, p.type from sqlite_master m join pragma_table_info(m.name) p
+		where m.type in ('table', 'view')
+		order by m.name, p.cid
+	''')
+	return catalog_metadata(cursor.fetchall(), _declared_affinity)
+
 @export
-def connect_sqlite(connstring: str) -> Connection:
-	return Connection(sqlite3.connect(connstring, isolation_level = None), _sqlite_metadata)
+def connect_sqlite(connstring: str, pool_size: int = 0) -> Connection:
+	import sqlite3
+
+	# every connection to an in-memory db gets a db of its own, so those can't be shared
+	if connstring in ('', ':memory:'):
+		pool_size = 0
+
+	def connect() -> DBConn:
+		# connections get used from collect_async's worker threads, and pooled ones by whichever thread checks them out
+		return sqlite3.connect(connstring, isolation_level = None, check_same_thread = False) # type: ignore
+
+	return pooled_connection(
+		('sqlite', connstring),
+		connect,
+		pool_size,
+		_sqlite_metadata,
+		get_all_table_metadata = _sqlite_all_metadata,
+		column_type_names = {Int: 'integer', Float: 'real', String: 'text', Bool: 'boolean'})
@@ -0,0 +1,29 @@
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from qry.common import export, export_named
+
+from .dataframe import DataFrame
+from .sql import QueryPipeline
+
+# queries collected in the background, so independent ones can run at the same time
+
+@export
+@dataclass
+class QueryFuture:
+	future: 'Future[DataFrame]'
+
+@export
+def collect_async(query: QueryPipeline) -> QueryFuture:
+	return QueryFuture(query.execute_async())
+
+# errors from the query are raised here rather than where it was started
+@export_named('await')
+def await_(future: QueryFuture) -> DataFrame:
+	return future.future.result()
+
+# waits for every future, so that awaiting any of them afterwards returns straight away
+@export
+def gather(*futures: QueryFuture) -> None:
+	for f in futures:
+		f.future.result()
@@ -1,19 +1,31 @@
-from typing import Optional, Iterable, Any, List, Dict, Tuple, Union, Callable
+from typing import Optional, Iterable, Iterator, Any, List, Dict, Set, Tuple, Union, Callable, cast
 from typing_extensions import Protocol
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from enum import Enum, auto
+from operator import itemgetter
+import re
+from concurrent.futures import Future
 
 import pyarrow
 
 from qry.common import export
-from qry.lang import Expr, IdentExpr
+from qry.lang import Expr, IdentExpr, BinaryOpExpr, BinaryOp, String, Int, Float, Bool
 from qry.runtime import Environment, QryRuntimeError
 
 from .dataframe import DataFrame
-from .sql_codegen import SQLExpressionTranslator
-from .sql_connection import Connection, DBCursor, SQLExpression
-
-def metadata_from_typecode_lookup(types: Dict[Any, type]) -> Any:
+from .sql_codegen import SQLExpressionTranslator, referenced_columns
+from .sql_connection import Connection, DBCursor, SQLExpression, QueryParams
+from .sql_cache import ResultCache
+
+def _description_typecodes(cursor: DBCursor) -> Iterable[Tuple[str, Any]]:
+	return [(desc[0], desc[1]) for desc in cursor.description]
+
+# column_typecodes can read typecodes from somewhere other than the cursor description
+# for dbs which don't put enough in it
+def metadata_from_typecode_lookup(
+	types: Dict[Any, type],
+	column_typecodes: Callable[[DBCursor], Iterable[Tuple[str, Any]]] = _description_typecodes,
+) -> Any:
 	def _get_type(typecode: Any) -> type:
 		ret = types.get(typecode)
 		if not ret:
@@ -25,10 +37,147 @@ def metadata_from_typecode_lookup(types: Dict[Any, type]) -> Any:
 		cursor = conn.c.cursor()
 		cursor.execute(f'select * from {table} limit 0')
 		cursor.fetchall()
-		return {desc[0]: _get_type(desc[1]) for desc in cursor.description}
+		return {name: _get_type(typecode) for name, typecode in column_typecodes(cursor)}
 
 	return _get_table_metadata
 
+# builds table schemas from (table, column, type name) rows of a catalog query
+def catalog_metadata(
+	rows: Iterable[Tuple[str, str, str]],
+	get_type: Callable[[str], Optional[type]],
+) -> Dict[str, Dict[str, type]]:
+	ret: Dict[str, Dict[str, type]] = {}
+	unhandled = set()
+	for table, column, type_name in rows:
+		column_type = get_type(type_name)
+		if column_type is None:
+			unhandled.add(table)
+		else:
+			ret.setdefault(table, {})[column] = column_type
+
+	# tables we can't handle are left for get_table to report on when they're used
+	for table in unhandled:
+		ret.pop(table, None)
+	return ret
+
+def metadata_from_catalog(sql: str, types: Dict[str, type]) -> Any:
+	def _get_all_table_metadata(conn: Connection) -> Dict[str, Dict[str, type]]:
+		cursor = conn.c.cursor()
+		cursor.execute(sql)
+		return catalog_metadata(cursor.fetchall(), lambda type_name: types.get(type_name.lower()))
+
+	return _get_all_table_metadata
+
+arrow_types = {
+	Int: pyarrow.int64(),
+	Float: pyarrow.float64(),
+	String: pyarrow.string(),
+	Bool: pyarrow.bool_(),
+}
+
+def _arrow_column_types(column_names: List[str], columns: Dict[str, type]) -> List[Optional[pyarrow.DataType]]:
+	# some dbs fold the case of unquoted names, so fall back to a case insensitive match
+	folded_columns = {name.lower(): t for name, t in columns.items()}
+	column_types = [columns.get(name, folded_columns.get(name.lower())) for name in column_names]
+	return [arrow_types.get(t) if t else None for t in column_types]
+
+class _ColumnBuilder:
+	# converts batches of python values into arrow chunks, using the expected type when we know it
+	# if the db hands back something else, we go back to letting arrow infer the type
+	type: Optional[pyarrow.DataType]
+	chunks: List[pyarrow.Array]
+
+	def __init__(self, type: Optional[pyarrow.DataType]) -> None:
+		self.type = type
+		self.chunks = []
+
+	def convert(self, values: List[Any]) -> pyarrow.Array:
+		try:
+			return pyarrow.array(values, type = self.type)
+		except pyarrow.ArrowException:
+			pass
+
+		# dbs without a real boolean type, like sqlite, hand bools back as 0 and 1
+		if self.type == pyarrow.bool_():
+			try:
+				return pyarrow.array(values, type = pyarrow.int64()).cast(pyarrow.bool_())
+			except pyarrow.ArrowException:
+				pass
+
+		self.type = None
+		return pyarrow.array(values)
+
+	def finish(self) -> pyarrow.ChunkedArray:
+		chunk_types = {c.type for c in self.chunks if c.type != pyarrow.null()}
+		if len(chunk_types) > 1:
+			values = [v for c in self.chunks for v in c.to_pylist()]
+			return pyarrow.chunked_array([pyarrow.array(values)])
+
+		chunk_type = chunk_types.pop() if chunk_types else self.type or pyarrow.null()
+		chunks = [c if c.type == chunk_type else pyarrow.nulls(len(c), chunk_type) for c in self.chunks]
+		return pyarrow.chunked_array(chunks, chunk_type)
+
+class _ResultReader:
+	# server side cursors only describe their results after the first fetch, so columns are set up lazily
+	cursor: DBCursor
+	columns: Dict[str, type]
+	batch_size: int
+	names: List[str]
+	builders: List[_ColumnBuilder]
+
+	def __init__(self, cursor: DBCursor, columns: Dict[str, type], batch_size: int) -> None:
+		self.cursor = cursor
+		self.columns = columns
+		self.batch_size = batch_size
+		self.names = []
+		self.builders = []
+
+	def __iter__(self) -> Iterator[List[pyarrow.Array]]:
+		while True:
+			rows = self.cursor.fetchmany(self.batch_size)
+			if not self.builders:
+				self.names = [desc[0] for desc in self.cursor.description]
+				self.builders = [_ColumnBuilder(t) for t in _arrow_column_types(self.names, self.columns)]
+
+			if not rows:
+				return
+
+			# zip(*rows) looks tempting, but is several times slower than pulling out each column in turn
+			arrays = [b.convert(list(map(itemgetter(index), rows))) for index, b in enumerate(self.builders)]
+			del rows
+			yield arrays
+
+def fetch_table(cursor: DBCursor, columns: Dict[str, type], batch_size: int) -> pyarrow.Table:
+	reader = _ResultReader(cursor, columns, batch_size)
+	for arrays in reader:
+		for builder, arr in zip(reader.builders, arrays):
+			builder.chunks.append(arr)
+
+	return pyarrow.Table.from_arrays([b.finish() for b in reader.builders], reader.names)
+
+def fetch_batches(cursor: DBCursor, columns: Dict[str, type], batch_size: int) -> Iterator[pyarrow.RecordBatch]:
+	reader = _ResultReader(cursor, columns, batch_size)
+	for arrays in reader:
+		yield pyarrow.RecordBatch.from_arrays(arrays, reader.names)
+
+# sql an order is on, and whether it's descending
+OrderBy = List[Tuple[str, bool]]
+
+def _order_clause(order_by: OrderBy) -> str:
+	if not order_by:
+		return ''
+	return ' order by ' + ', '.join([f'{text} desc' if desc else text for text, desc in order_by])
+
+# rows selected from an ordered subquery can only keep its order by those of its terms which are still available
+# that's the longest prefix of them, mapped to the sql they're available as now
+def _carry_order(order_by: OrderBy, available: Dict[str, str]) -> OrderBy:
+	carried = []
+	for text, desc in order_by:
+		if text not in available:
+			break
+		carried.append((available[text], desc))
+	return carried
+
 @dataclass
 class RenderStateCounter:
 	_alias: int
@@ -39,25 +188,102 @@ class RenderState:
 	query: str
 	columns: Dict[str, type]
 	counter: RenderStateCounter
+	# parameters for the whole query, which every state rendering part of it adds to
+	params: QueryParams = field(default_factory = dict)
+	# columns the rows are ordered by, which steps keeping that order select them by again
+	# subqueries aren't guaranteed to keep their order, so it's only certain in the outermost select
+	order_by: OrderBy = field(default_factory = list)
 
 	def substate(self) -> 'RenderState':
-		return RenderState(self.conn, '', {}, self.counter)
+		return RenderState(self.conn, '', {}, self.counter, self.params)
 
-	def copy(self, new_query: str, columns: Dict[str, type]) -> 'RenderState':
+	def copy(self, new_query: str, columns: Dict[str, type], order_by: Optional[OrderBy] = None) -> 'RenderState':
 		assert len(columns)
-		return RenderState(self.conn, new_query, columns, self.counter)
+		return RenderState(self.conn, new_query, columns, self.counter, self.params, order_by or [])
 
-	def subquery(self) -> str:
+	def alias(self) -> str:
 		self.counter._alias += 1
-		return f'({self.query}) qry_{self.counter._alias}'
+		return f'qry_{self.counter._alias}'
+
+	def subquery(self) -> str:
+		return f'({self.query}) {self.alias()}'
 
 	def translator(self, env: Environment) -> SQLExpressionTranslator:
-		return SQLExpressionTranslator(self.conn, env, self.columns)
+		return SQLExpressionTranslator(self.conn, env, self.columns, self.params)
+
+	def block_translator(self, env: Environment, block: 'SelectBlock') -> SQLExpressionTranslator:
+		return SQLExpressionTranslator(self.conn, env, block.columns, self.params, block.exprs)
+
+def _conjunction(conditions: List[str]) -> str:
+	return conditions[0] if len(conditions) == 1 else ' and '.join([f'({c})' for c in conditions])
+
+# a single select which consecutive steps of a pipeline are folded into
+# rather than each wrapping the last in a subquery
+# columns map to the sql computing them from the source, so later steps can refer to them wherever they end up
+@dataclass
+class SelectBlock:
+	source: str
+	columns: Dict[str, type]
+	exprs: Dict[str, str]
+	where: List[str] = field(default_factory = list)
+	# set once aggregated, after which filters go into having instead
+	group_by: Optional[List[str]] = None
+	having: List[str] = field(default_factory = list)
+	# whether the source joins several tables
+	joined: bool = False
+	order_by: OrderBy = field(default_factory = list)
+	limit: Optional[int] = None
+
+	@staticmethod
+	def over(state: RenderState, source: str, columns: Dict[str, type]) -> 'SelectBlock':
+		alias = state.alias()
+		return SelectBlock(f'{source} {alias}', columns, {name: f'{alias}.{name}' for name in columns})
+
+	# starts a new block selecting from this one
+	# the order is only needed inside to pick the rows a limit keeps
+	# otherwise it's applied outside, where it's certain to hold
+	def wrap(self, state: RenderState) -> 'SelectBlock':
+		inner = self if self.limit is not None else replace(self, order_by = [])
+		block = SelectBlock.over(state, f'({inner.render()})', self.columns)
+		available = {text: block.exprs[name] for name, text in self.exprs.items()}
+		return replace(block, order_by = _carry_order(self.order_by, available))
+
+	def render(self) -> str:
+		def projection(name: str, text: str) -> str:
+			return text if text == name or text.endswith(f'.{name}') else f'{text} as {name}'
+
+		sql = f'select {", ".join([projection(n, t) for n, t in self.exprs.items()])} from {self.source}'
+		if self.where:
+			sql += f' where {_conjunction(self.where)}'
+		if self.group_by:
+			sql += f' group by {", ".join(self.group_by)}'
+		if self.having:
+			sql += f' having {_conjunction(self.having)}'
+		sql += _order_clause(self.order_by)
+		if self.limit is not None:
+			sql += f' limit {self.limit}'
+		return sql
 
 class QueryStep(Protocol):
 	def render(self, state: RenderState) -> RenderState:
 		...
 
+# steps can also be folded into the current select block by a flatten method
+# it returns None when that isn't safe, in which case the step is retried over a fresh block wrapping the current one
+def _flatten_step(step: QueryStep, state: RenderState, block: Optional[SelectBlock]) -> SelectBlock:
+	flatten = getattr(step, 'flatten', None)
+	if flatten is not None:
+		ret = flatten(state, block)
+		if ret is None and block is not None:
+			ret = flatten(state, block.wrap(state))
+		if ret is not None:
+			return cast(SelectBlock, ret)
+
+	# steps which can't be flattened at all are rendered as before
+	nested = state.copy(block.render(), block.columns) if block else state.substate()
+	nested = step.render(nested)
+	return SelectBlock.over(state, f'({nested.query})', nested.columns)
+
 @export
 @dataclass
 class QueryPipeline:
@@ -75,22 +301,86 @@ class QueryPipeline:
 			state = step.render(state)
 		return state
 
-	def execute(self) -> DataFrame:
-		state = self.render(RenderState(self.conn, '', {}, RenderStateCounter(0)))
-		cursor = self.conn.c.cursor()
-		cursor.execute(state.query)
-		column_names = [desc[0] for desc in cursor.description]
-		rows = cursor.fetchall()
-		column_data: List[Any] = [[] for c in column_names]
-
-		for row_index, row in enumerate(rows):
-			for col_index in range(0, len(column_names)):
-				col = column_data[col_index]
-				col.append(row[col_index])
-
-		table = pyarrow.Table.from_arrays([pyarrow.array(a) for a in column_data], column_names)
+	def flatten(self, state: RenderState) -> SelectBlock:
+		block: Optional[SelectBlock] = None
+		for step in self.steps:
+			block = _flatten_step(step, state, block)
+		assert block is not None
+		return block
+
+	# steps can narrow themselves to the columns used after them with a prune method
+	# it returns the narrowed step along with the columns it needs from the step before, where None means all of them
+	def prune(self, needed: Optional[Set[str]] = None) -> 'QueryPipeline':
+		steps = []
+		for step in reversed(self.steps):
+			prune = getattr(step, 'prune', None)
+			if prune is None:
+				needed = None
+			else:
+				step, needed = prune(needed)
+			steps.append(step)
+
+		steps.reverse()
+		return QueryPipeline(self.conn, steps)
+
+	def _render_query(self, flatten: Optional[bool] = None) -> RenderState:
+		state = RenderState(self.conn, '', {}, RenderStateCounter(0))
+		pipeline = self.prune()
+		if not (self.conn.flatten_queries if flatten is None else flatten):
+			return pipeline.render(state)
+
+		block = pipeline.flatten(state)
+		return state.copy(block.render(), block.columns)
+
+	def _execute_cursor(self, conn: Connection, state: RenderState, stream: bool = False) -> DBCursor:
+		cursor = conn.query_cursor(state.query, state.params, stream)
+		conn.run_query(cursor, state.query, state.params)
+		return cursor
+
+	def _fetch_table(self, state: RenderState) -> pyarrow.Table:
+		with self.conn.checkout() as conn:
+			if conn.bulk_fetch:
+				table = conn.bulk_fetch(conn, state.query, state.params, state.columns)
+				if table is not None:
+					return table
+
+			cursor = self._execute_cursor(conn, state)
+			try:
+				return fetch_table(cursor, state.columns, conn.fetch_batch_size)
+			finally:
+				cursor.close()
+
+	def _fetch(self, state: RenderState) -> DataFrame:
+		cache = self.conn.result_cache
+		if cache is None:
+			return DataFrame(self._fetch_table(state))
+
+		# 2, 2.0 and True are equal keys, but don't give the same results
+		key = (state.query, tuple((name, type(value), value) for name, value in state.params.items()))
+		table = cache.get(key)
+		if table is None:
+			generation = cache.generation
+			table = self._fetch_table(state)
+			cache.put(key, table, generation)
 		return DataFrame(table)
 
+	def execute(self) -> DataFrame:
+		return self._fetch(self._render_query())
+
+	# rendering reads the caller's environment, so only fetching is left to the background thread
+	def execute_async(self) -> 'Future[DataFrame]':
+		return self.conn.executor().submit(self._fetch, self._render_query())
+
+	# the query only runs once iteration starts, and the cursor and connection are released as soon as it stops
+	def execute_batches(self, batch_size: int) -> Iterator[pyarrow.RecordBatch]:
+		state = self._render_query()
+		with self.conn.checkout() as conn:
+			cursor = self._execute_cursor(conn, state, stream = True)
+			try:
+				yield from fetch_batches(cursor, state.columns, batch_size)
+			finally:
+				cursor.close()
+
 @dataclass
 class Filter:
 	env: Environment
@@ -99,7 +389,24 @@ class Filter:
 	def render(self, state: RenderState) -> RenderState:
 		translator = state.translator(self.env)
 		filter_expr = translator.eval(self.expr)
-		return state.copy(f'select * from {state.subquery()} where {filter_expr.text}', state.columns)
+		return state.copy(
+			f'select * from {state.subquery()} where {filter_expr.text}{_order_clause(state.order_by)}',
+			state.columns,
+			state.order_by,
+		)
+
+	# filtering the rows a limit kept isn't the same as filtering before limiting
+	def flatten(self, state: RenderState, block: SelectBlock) -> Optional[SelectBlock]:
+		if block.limit is not None:
+			return None
+
+		condition = state.block_translator(self.env, block).eval(self.expr).text
+		if block.group_by is None:
+			return replace(block, where = block.where + [condition])
+		return replace(block, having = block.having + [condition])
+
+	def prune(self, needed: Optional[Set[str]]) -> Tuple['Filter', Optional[Set[str]]]:
+		return self, None if needed is None else needed | referenced_columns(self.expr)
 
 @dataclass
 class Count:
@@ -108,19 +415,119 @@ class Count:
 
 class JoinType(Enum):
 	CROSS = "cross"
+	INNER = "inner"
 	LEFT = "left"
+	# semi and anti joins keep the lhs rows which do or don't have a match, without adding any rhs columns
+	SEMI = "semi"
+	ANTI = "anti"
+
+_filtering_joins = {
+	JoinType.SEMI: 'exists',
+	JoinType.ANTI: 'not exists',
+}
+
+_comparison_ops = {
+	BinaryOp.EQUAL,
+	BinaryOp.NOT_EQUAL,
+	BinaryOp.GREATER_THAN,
+	BinaryOp.GREATER_THAN_OR_EQUAL,
+	BinaryOp.LESS_THAN,
+	BinaryOp.LESS_THAN_OR_EQUAL,
+}
+
+# each key is either the name of a column on both sides, or a comparison of a lhs column with a rhs column
+def _join_condition(state: RenderState, env: Environment, keys: List[Expr], lhs: SelectBlock, rhs: SelectBlock) -> str:
+	lhs_translator = state.block_translator(env, lhs)
+	rhs_translator = state.block_translator(env, rhs)
+	conditions = []
+	for key in keys:
+		if isinstance(key, IdentExpr):
+			if key.value not in lhs.columns or key.value not in rhs.columns:
+				raise QryRuntimeError(f'join key is not a column of both sides: {key.value}')
+			condition = lhs_translator.eval_binop(BinaryOp.EQUAL, lhs_translator.eval(key), rhs_translator.eval(key))
+		elif isinstance(key, BinaryOpExpr) and key.op in _comparison_ops:
+			lhs_operand = lhs_translator.eval_operand(key.lhs)
+			condition = lhs_translator.eval_binop(key.op, lhs_operand, rhs_translator.eval_operand(key.rhs))
+		else:
+			raise QryRuntimeError(
+				f'expected a column name or a comparison between the two sides as a join key: {key.render()}')
+		conditions.append(condition.text)
+	return _conjunction(conditions)
+
+# sql which reads a column as is, rather than computing anything from it
+_qualified_column = re.compile(r'[A-Za-z_]\w*\.[A-Za-z_]\w*')
+
+# columns both sides have are taken from the lhs, which is the one a left join always has values for
+def _join_columns(lhs: Dict[str, Any], rhs: Dict[str, Any]) -> Dict[str, Any]:
+	return {**lhs, **{name: c for name, c in rhs.items() if name not in lhs}}
 
 @dataclass
 class Join:
 	type: JoinType
 	rhs: QueryPipeline
-
+	env: Optional[Environment] = None
+	on: List[Expr] = field(default_factory = list)
+
+	def _join(self, state: RenderState, lhs: SelectBlock, rhs: SelectBlock) -> SelectBlock:
+		condition = None
+		if self.on:
+			assert self.env is not None
+			condition = _join_condition(state, self.env, self.on, lhs, rhs)
+
+		filtering = _filtering_joins.get(self.type)
+		if filtering is not None:
+			assert condition is not None
+			exists = f'{filtering} (select 1 from {rhs.source} where {_conjunction(rhs.where + [condition])})'
+			return replace(lhs, where = lhs.where + [exists])
+
+		source = f'{lhs.source} {self.type.value} join {rhs.source}'
+		if condition is not None:
+			source += f' on {condition}'
+		return SelectBlock(
+			source,
+			_join_columns(lhs.columns, rhs.columns),
+			_join_columns(lhs.exprs, rhs.exprs),
+			lhs.where + rhs.where,
+			joined = True,
+			order_by = lhs.order_by,
+		)
+
+	# joined rows keep the order of the lhs, whose columns keep their names
 	def render(self, state: RenderState) -> RenderState:
 		join_state = self.rhs.render(state.substate())
-		return state.copy(f'select * from {state.subquery()} {self.type.value} join {join_state.subquery()}', {
-			**state.columns,
-			**join_state.columns,
-		})
+		lhs = SelectBlock.over(state, f'({state.query})', state.columns)
+		lhs.order_by = [(lhs.exprs[name], desc) for name, desc in state.order_by]
+		rhs = SelectBlock.over(state, f'({join_state.query})', join_state.columns)
+		block = self._join(state, lhs, rhs)
+		return state.copy(block.render(), block.columns, state.order_by)
+
+	def flatten(self, state: RenderState, block: SelectBlock) -> Optional[SelectBlock]:
+		if block.group_by is not None or block.limit is not None:
+			return None
+
+		# filters on the lhs mean the same before or after the join
+		# and so do those on the rhs of anything but a left join
+		# semi and anti joins keep the whole rhs inside their exists, so only an aggregated one needs a subquery
+		rhs = self.rhs.flatten(state)
+		wrap = rhs.group_by is not None or rhs.limit is not None
+		if self.type not in _filtering_joins:
+			wrap = wrap or rhs.joined
+		# rows a left join finds no match for are null in every rhs column, which computed ones only are from a subquery
+		if self.type == JoinType.LEFT:
+			wrap = wrap or bool(rhs.where) or not all([_qualified_column.fullmatch(e) for e in rhs.exprs.values()])
+		if wrap:
+			rhs = rhs.wrap(state)
+
+		return self._join(state, block, rhs)
+
+	# the columns needed could come from either side, so each keeps whichever of them it has along with the keys
+	def prune(self, needed: Optional[Set[str]]) -> Tuple['Join', Optional[Set[str]]]:
+		keys: Set[str] = set().union(*[referenced_columns(k) for k in self.on])
+		if self.type in _filtering_joins:
+			return replace(self, rhs = self.rhs.prune(keys)), None if needed is None else needed | keys
+
+		needed = None if needed is None else needed | keys
+		return replace(self, rhs = self.rhs.prune(needed)), needed
 
 @export
 @dataclass
@@ -148,14 +555,50 @@ class Aggregate:
 		select_computed = [f'{c.text} as {name}' for name, c in computed_col_details.items()]
 
 		select_expr = ', '.join(names + select_computed)
+		group_by = f' group by {grouping_expr}' if grouping_expr else ''
 		return state.copy(
-			f'select {select_expr} from {state.subquery()} group by {grouping_expr}', {
+			f'select {select_expr} from {state.subquery()}{group_by}', {
 			**{c.text: c.type
 			for c in grouping_col_details},
 			**{name: c.type
 			for name, c in computed_col_details.items()},
 			})
 
+	# the order of the rows being aggregated doesn't carry over to the groups
+	def flatten(self, state: RenderState, block: SelectBlock) -> Optional[SelectBlock]:
+		if block.group_by is not None or block.limit is not None:
+			return None
+
+		grouping_translator = state.block_translator(self.by.env, block)
+		keys = {}
+		for e in self.by.names:
+			key = grouping_translator.eval(e, constrain_to = IdentExpr)
+			keys[cast(IdentExpr, e).value] = key
+		computed_keys = {name: grouping_translator.eval(c) for name, c in self.by.computed.items()}
+
+		translator = state.block_translator(self.env, block)
+		aggregations = {name: translator.eval(c) for name, c in self.aggregations.items()}
+
+		outputs = {**keys, **computed_keys, **aggregations}
+		return replace(
+			block,
+			columns = {name: c.type for name, c in outputs.items()},
+			exprs = {name: c.text for name, c in outputs.items()},
+			group_by = [c.text for c in list(keys.values()) + list(computed_keys.values())],
+			order_by = [],
+		)
+
+	# keys are always kept since they decide the groups, but aggregations nothing uses are dropped
+	def prune(self, needed: Optional[Set[str]]) -> Tuple['Aggregate', Optional[Set[str]]]:
+		aggregations = self.aggregations
+		if needed is not None:
+			aggregations = {name: c for name, c in aggregations.items() if name in needed}
+		if not (aggregations or self.by.names or self.by.computed):
+			aggregations = dict(list(self.aggregations.items())[:1])
+
+		exprs = self.by.names + list(self.by.computed.values()) + list(aggregations.values())
+		return replace(self, aggregations = aggregations), set().union(*[referenced_columns(e) for e in exprs])
+
 @dataclass
 class Select:
 	env: Environment
@@ -175,12 +618,56 @@ class Select:
 		select_computed = [f'{c.text} as {name}' for name, c in computed_col_details.items()]
 		select_expr = ', '.join(names + select_computed)
 
-		return state.copy(f'select {select_expr} from {state.subquery()}', {
+		# the order can still use columns which aren't selected
+		# but it only carries over through those which are, unchanged
+		order_by = _carry_order(state.order_by, {name: name for name in names if name not in self.computed})
+		return state.copy(f'select {select_expr} from {state.subquery()}{_order_clause(state.order_by)}', {
 			**{s.text: s.type
 			for s in selection_details},
 			**{name: c.type
 			for name, c in computed_col_details.items()},
-		})
+		}, order_by)
+
+	# selected columns keep the sql they were computed with, so selecting never needs a select of its own
+	def flatten(self, state: RenderState, block: SelectBlock) -> Optional[SelectBlock]:
+		translator = state.block_translator(self.env, block)
+		if self.selection:
+			columns = {}
+			exprs = {}
+			for e in self.selection:
+				selected = translator.eval(e, constrain_to = IdentExpr)
+				name = cast(IdentExpr, e).value
+				columns[name] = selected.type
+				exprs[name] = block.exprs[name]
+		else:
+			columns = dict(block.columns)
+			exprs = dict(block.exprs)
+
+		for name, c in self.computed.items():
+			computed = translator.eval(c)
+			columns[name] = computed.type
+			exprs[name] = computed.text
+
+		return replace(block, columns = columns, exprs = exprs)
+
+	def prune(self, needed: Optional[Set[str]]) -> Tuple['Select', Optional[Set[str]]]:
+		selection = self.selection
+		computed = self.computed
+		if needed is not None:
+			selection = [e for e in selection if not isinstance(e, IdentExpr) or e.value in needed]
+			computed = {name: c for name, c in computed.items() if name in needed}
+		if self.selection and not (selection or computed):
+			selection = self.selection[:1]
+
+		pruned = replace(self, selection = selection, computed = computed)
+		used = set().union(*[referenced_columns(c) for c in computed.values()])
+		if selection:
+			return pruned, used.union(*[referenced_columns(e) for e in selection])
+
+		# mutations pass on every column they don't replace
+		if needed is None:
+			return pruned, None
+		return pruned, (needed - set(self.computed)) | used
 
 @dataclass
 class From:
@@ -191,17 +678,207 @@ class From:
 		names = ', '.join(self.columns.keys())
 		return state.copy(f'select {names} from {self.table}', self.columns)
 
+	def flatten(self, state: RenderState, block: Optional[SelectBlock]) -> SelectBlock:
+		return SelectBlock.over(state, self.table, self.columns)
+
+	# a query has to select something, so a table nothing is read from still gives its first column
+	def prune(self, needed: Optional[Set[str]]) -> Tuple['From', Optional[Set[str]]]:
+		if needed is None:
+			return self, None
+
+		columns = {name: t for name, t in self.columns.items() if name in needed}
+		return replace(self, columns = columns or dict(list(self.columns.items())[:1])), set()
+
+# later arranges take precedence, with the order from earlier ones breaking ties
+@dataclass
+class Arrange:
+	env: Environment
+	by: Expr
+	desc: bool
+
+	def render(self, state: RenderState) -> RenderState:
+		name = state.translator(self.env).eval(self.by, constrain_to = IdentExpr).text
+		order_by = [(name, self.desc)] + state.order_by
+		return state.copy(f'select * from {state.subquery()}{_order_clause(order_by)}', state.columns, order_by)
+
+	def flatten(self, state: RenderState, block: SelectBlock) -> Optional[SelectBlock]:
+		if block.limit is not None:
+			return None
+
+		state.block_translator(self.env, block).eval(self.by, constrain_to = IdentExpr)
+		text = block.exprs[cast(IdentExpr, self.by).value]
+		return replace(block, order_by = [(text, self.desc)] + block.order_by)
+
+	def prune(self, needed: Optional[Set[str]]) -> Tuple['Arrange', Optional[Set[str]]]:
+		return self, None if needed is None else needed | referenced_columns(self.by)
+
+# keeps the first n rows in the current order, which is a top n query after an arrange
+@dataclass
+class Head:
+	n: int
+
+	def render(self, state: RenderState) -> RenderState:
+		return state.copy(
+			f'select * from {state.subquery()}{_order_clause(state.order_by)} limit {self.n}',
+			state.columns,
+			state.order_by,
+		)
+
+	def flatten(self, state: RenderState, block: SelectBlock) -> Optional[SelectBlock]:
+		return replace(block, limit = self.n if block.limit is None else min(block.limit, self.n))
+
+	def prune(self, needed: Optional[Set[str]]) -> Tuple['Head', Optional[Set[str]]]:
+		return self, needed
+
+# statements which can't change any data, so don't need to invalidate cached results
+_read_only_statements = {'select', 'explain', 'show', 'describe'}
+# statements which may change the schema of some table
+_schema_statements = {'create', 'alter', 'drop', 'rename'}
+
+def _invalidate_results(conn: Connection, sql: str) -> None:
+	words = sql.split(maxsplit = 1)
+	statement = words[0].lower() if words else ''
+	if conn.result_cache is not None and statement not in _read_only_statements:
+		conn.result_cache.invalidate()
+	if statement in _schema_statements:
+		conn.schemas.clear()
+
+# statements which can't leave anything behind in the db session, unless they create a temp table
+_sessionless_statements = {
+	'select', 'with', 'insert', 'update', 'delete', 'replace', 'create', 'alter', 'drop', 'rename', 'truncate',
+	'explain', 'show', 'describe', 'comment', 'grant', 'revoke', 'analyze', 'vacuum'
+}
+
+def _changes_session(sql: str) -> bool:
+	words = sql.lower().split(maxsplit = 2)
+	if not words or words[0] not in _sessionless_statements:
+		return True
+	return words[0] == 'create' and len(words) > 1 and words[1] in ('temp', 'temporary')
+
+# pooled connections may run each statement on a different db connection, so session state doesn't last between them
+# transactions, temp tables and session settings are dropped along with the db connection they were made on
 @export
 def execute(conn: Connection, sql: str) -> int:
+	try:
+		with conn.checkout() as checked_out:
+			checked_out.session_changed = _changes_session(sql)
+			cursor = checked_out.c.cursor()
+			cursor.execute(sql)
+			return cursor.rowcount
+	finally:
+		_invalidate_results(conn, sql)
+
+# collected results are reused until they expire, or until execute or write_table change something through conn
+# results streamed through collect_batches are never cached
+@export
+def cache_results(conn: Connection, max_mb: int = 256, ttl_seconds: float = 300) -> Connection:
+	conn.result_cache = ResultCache(max_mb * 1024 * 1024, ttl_seconds)
+	return conn
+
+@export
+def cache_hits(conn: Connection) -> int:
+	return conn.result_cache.hits if conn.result_cache else 0
+
+@export
+def cache_misses(conn: Connection) -> int:
+	return conn.result_cache.misses if conn.result_cache else 0
+
+class WriteMode(Enum):
+	APPEND = 'append'
+	REPLACE = 'replace'
+
+def _column_definitions(conn: Connection, table: pyarrow.Table) -> str:
+	qry_types = {arrow_type: t for t, arrow_type in arrow_types.items()}
+	definitions = []
+	for f in table.schema:
+		qry_type = qry_types.get(f.type)
+		if qry_type is None:
+			raise QryRuntimeError(f'unsupported column type for writing: {f.name} ({f.type})')
+		definitions.append(f'{f.name} {conn.column_type_names[qry_type]}')
+	return ', '.join(definitions)
+
+def _row_batches(table: pyarrow.Table, batch_size: int) -> Iterator[List[Tuple[Any, ...]]]:
+	for batch in table.to_batches(batch_size):
+		yield list(zip(*[c.to_pylist() for c in batch.columns]))
+
+def _insert_rows(conn: Connection, table: str, names: List[str], batches: Iterator[List[Tuple[Any, ...]]]) -> None:
+	placeholders = ', '.join([conn.placeholder] * len(names))
+	sql = f'insert into {table} ({", ".join(names)}) values ({placeholders})'
 	cursor = conn.c.cursor()
-	cursor.execute(sql)
-	return cursor.rowcount
+	for rows in batches:
+		cursor.executemany(sql, rows)
+
+# the table is dropped and created in the same transaction as the rows are written
+# so a failed replace keeps the old rows, except on mysql, which commits ddl implicitly
+def _write_rows(conn: Connection, data: pyarrow.Table, table: str, mode: WriteMode, batch_size: int) -> None:
+	cursor = conn.c.cursor()
+	write_rows = conn.bulk_insert or _insert_rows
+	cursor.execute('begin')
+	try:
+		if mode == WriteMode.REPLACE:
+			cursor.execute(f'drop table if exists {table}')
+		cursor.execute(f'create table if not exists {table} ({_column_definitions(conn, data)})')
+		write_rows(conn, table, data.column_names, _row_batches(data, batch_size))
+	except Exception:
+		cursor.execute('rollback')
+		raise
+	cursor.execute('commit')
+
+# append creates the table if it doesn't exist yet, and replace drops any existing one first
+# rows are written in a single transaction, through the connection's bulk insert where it has one
+@export
+def write_table(conn: Connection, df: DataFrame, table: str, mode: str = 'append', batch_size: int = 10000) -> int:
+	try:
+		write_mode = WriteMode(mode)
+	except ValueError:
+		raise QryRuntimeError(f'unknown write mode: {mode}') from None
+
+	try:
+		with conn.checkout() as checked_out:
+			_write_rows(checked_out, df.table, table, write_mode, batch_size)
+	finally:
+		conn.schemas.pop(table, None)
+		if conn.result_cache is not None:
+			conn.result_cache.invalidate()
+
+	return cast(int, df.table.num_rows)
+
+def _table_metadata(conn: Connection, table: str) -> Dict[str, type]:
+	metadata = conn.schemas.get(table)
+	if metadata is None:
+		with conn.checkout() as checked_out:
+			metadata = checked_out.get_table_metadata(checked_out, table)
+		conn.schemas[table] = metadata
+	return metadata
 
 @export
 def get_table(conn: Connection, table: str) -> QueryPipeline:
-	metadata_func = conn.get_table_metadata
-	metadata = metadata_func(conn, table) # type: ignore
-	return QueryPipeline(conn, [From(table, metadata)])
+	return QueryPipeline(conn, [From(table, _table_metadata(conn, table))])
+
+# fetches and caches the schemas of the given tables up front, or of every table when none are given
+# this takes a single catalog query where the db supports one
+@export
+def prefetch_schemas(conn: Connection, *tables: str) -> int:
+	if conn.get_all_table_metadata is None:
+		for table in tables:
+			_table_metadata(conn, table)
+		return len(tables)
+
+	with conn.checkout() as checked_out:
+		schemas = conn.get_all_table_metadata(checked_out)
+
+	if tables:
+		schemas = {t: schemas[t] for t in tables if t in schemas}
+	conn.schemas.update(schemas)
+	return len(schemas)
+
+# drops cached schemas for the given tables, or for every table when none are given
+@export
+def refresh_schemas(conn: Connection, *tables: str) -> None:
+	if not tables:
+		conn.schemas.clear()
+	for table in tables:
+		conn.schemas.pop(table, None)
 
 @export
 def filter(_env: Environment, query: QueryPipeline, expr: Expr) -> QueryPipeline:
@@ -211,6 +888,21 @@ def filter(_env: Environment, query: QueryPipeline, expr: Expr) -> QueryPipeline
 def collect(query: QueryPipeline) -> DataFrame:
 	return query.execute()
 
+# the sql a query runs as, with interpolated values left as placeholders
+@export
+def render_sql(query: QueryPipeline, flatten: bool = True) -> str:
+	return query._render_query(flatten).query
+
+@export
+def arrange(_env: Environment, query: QueryPipeline, by: Expr, desc: bool = False) -> QueryPipeline:
+	return query.chain(Arrange(_env, by, desc))
+
+@export
+def head(query: QueryPipeline, n: int = 10) -> QueryPipeline:
+	if n < 0:
+		raise QryRuntimeError(f'expected a non-negative number of rows: {n}')
+	return query.chain(Head(n))
+
 @export
 def group(_env: Environment, *by: Expr, **named_by: Expr) -> Grouping:
 	return Grouping(_env, list(by), named_by)
@@ -223,6 +915,34 @@ def aggregate(_env: Environment, query: QueryPipeline, by: Grouping, **computati
 def cross_join(query: QueryPipeline, rhs: QueryPipeline) -> QueryPipeline:
 	return query.chain(Join(JoinType.CROSS, rhs))
 
+def _keyed_join(
+	env: Environment,
+	query: QueryPipeline,
+	rhs: QueryPipeline,
+	type: JoinType,
+	on: Tuple[Expr, ...],
+) -> QueryPipeline:
+	if not on:
+		raise QryRuntimeError(f'{type.value} join needs at least one key')
+	return query.chain(Join(type, rhs, env, list(on)))
+
+# keys are column names both sides share, e.g. inner_join(cities, city), or comparisons with the lhs column first
+@export
+def inner_join(_env: Environment, query: QueryPipeline, rhs: QueryPipeline, *on: Expr) -> QueryPipeline:
+	return _keyed_join(_env, query, rhs, JoinType.INNER, on)
+
+@export
+def left_join(_env: Environment, query: QueryPipeline, rhs: QueryPipeline, *on: Expr) -> QueryPipeline:
+	return _keyed_join(_env, query, rhs, JoinType.LEFT, on)
+
+@export
+def semi_join(_env: Environment, query: QueryPipeline, rhs: QueryPipeline, *on: Expr) -> QueryPipeline:
+	return _keyed_join(_env, query, rhs, JoinType.SEMI, on)
+
+@export
+def anti_join(_env: Environment, query: QueryPipeline, rhs: QueryPipeline, *on: Expr) -> QueryPipeline:
+	return _keyed_join(_env, query, rhs, JoinType.ANTI, on)
+
 @export
 def mutate(_env: Environment, query: QueryPipeline, **computation: Expr) -> QueryPipeline:
 	return query.chain(Select(_env, [], computation))
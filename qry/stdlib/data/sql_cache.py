@@ -0,0 +1,72 @@
+from typing import Hashable, Optional, Tuple
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+import pyarrow
+
+# collected results keyed by their rendered sql and parameters, evicting the least recently used once over max_bytes
+# arrow tables are immutable, so cached results are handed out as is rather than copied
+class ResultCache:
+	max_bytes: int
+	# seconds a result stays valid for, or forever if not positive
+	ttl: float
+	hits: int
+	misses: int
+	size: int
+	# bumped by every invalidation, so results of queries which were already running then aren't stored
+	generation: int
+
+	entries: 'OrderedDict[Hashable, Tuple[pyarrow.Table, float]]'
+
+	def __init__(self, max_bytes: int, ttl: float) -> None:
+		self.max_bytes = max_bytes
+		self.ttl = ttl
+		self.hits = 0
+		self.misses = 0
+		self.size = 0
+		self.generation = 0
+		self.entries = OrderedDict()
+		self._lock = Lock()
+
+	def _remove(self, key: Hashable) -> None:
+		table, _ = self.entries.pop(key)
+		self.size -= table.nbytes
+
+	def get(self, key: Hashable) -> Optional[pyarrow.Table]:
+		with self._lock:
+			entry = self.entries.get(key)
+			if entry is not None and entry[1] < monotonic():
+				self._remove(key)
+				entry = None
+
+			if entry is None:
+				self.misses += 1
+				return None
+
+			self.hits += 1
+			self.entries.move_to_end(key)
+			return entry[0]
+
+	def put(self, key: Hashable, table: pyarrow.Table, generation: int) -> None:
+		if table.nbytes > self.max_bytes:
+			return
+
+		expires = monotonic() + self.ttl if self.ttl > 0 else float('inf')
+		with self._lock:
+			if generation != self.generation:
+				return
+
+			if key in self.entries:
+				self._remove(key)
+			self.entries[key] = (table, expires)
+			self.size += table.nbytes
+
+			while self.size > self.max_bytes:
+				self._remove(next(iter(self.entries)))
+
+	def invalidate(self) -> None:
+		with self._lock:
+			self.entries.clear()
+			self.size = 0
+			self.generation += 1
@@ -1,13 +1,14 @@
-from typing import Any, Tuple, Union, Dict, cast
-from dataclasses import dataclass
+from typing import Any, Tuple, Union, Dict, Set, cast
+import re
+from dataclasses import dataclass, field
 
 from qry.common import export
-from qry.runtime import Environment, QryRuntimeError, InterpreterHooks
+from qry.runtime import Environment, QryRuntimeError, InterpreterHooks, to_py
 from qry.lang import *
 
 from qry.stdlib.ops import binop_lookup, unop_lookup
 
-from .sql_connection import Connection, SQLExpression
+from .sql_connection import Connection, SQLExpression, QueryParams
 from .vector import scalar_to_vector_lookup
 
 _sql_binop_symbol_overrides = {
@@ -15,6 +16,8 @@ _sql_binop_symbol_overrides = {
 	BinaryOp.NOT_EQUAL: '<>',
 	BinaryOp.AND: 'and',
 	BinaryOp.OR: 'or',
+	BinaryOp.LOGICAL_AND: 'and',
+	BinaryOp.LOGICAL_OR: 'or',
 }
 
 _sql_binop_signature_symbol_overrides = {
@@ -22,6 +25,8 @@ _sql_binop_signature_symbol_overrides = {
 	(BinaryOp.ADD, String, String): '||',
 }
 
+_column_ref = re.compile(r'[A-Za-z_][\w.]*')
+
 def sql_interpret_value(value: Any) -> str:
 	if isinstance(value, String):
 		return f'\'{value.val}\''
@@ -30,9 +35,23 @@ def sql_interpret_value(value: Any) -> str:
 
 	raise Exception(f'unhandled value for sql: {value}')
 
+# every name an expr could read a column through, for working out which columns a query needs
+# interpolated values are evaluated outside the query, so nothing inside them is a column
+def referenced_columns(expr: Expr) -> Set[str]:
+	if isinstance(expr, IdentExpr):
+		return {expr.value}
+	elif isinstance(expr, BinaryOpExpr):
+		return referenced_columns(expr.lhs) | referenced_columns(expr.rhs)
+	elif isinstance(expr, UnaryOpExpr):
+		return referenced_columns(expr.arg)
+	elif isinstance(expr, CallExpr):
+		return set().union(*[referenced_columns(a) for a in expr.positional_args + list(expr.named_args.values())])
+
+	return set()
+
 def make_literal_eval(literal_type: type) -> Any:
-	def literal_eval(_: Any, expr: Any) -> SQLExpression:
-		return SQLExpression(type(expr.value), sql_interpret_value(expr.value))
+	def literal_eval(self: 'SQLExpressionTranslator', expr: Any) -> SQLExpression:
+		return SQLExpression(type(expr.value), self.conn.escape_text(sql_interpret_value(expr.value)))
 
 	return literal_eval
 
@@ -41,6 +60,10 @@ class SQLExpressionTranslator:
 	conn: Connection
 	env: Environment
 	columns: Dict[str, type]
+	# shared by every translator rendering the same query
+	params: QueryParams = field(default_factory = dict)
+	# sql for columns which are computed within the same select, rather than read from its source
+	column_exprs: Dict[str, str] = field(default_factory = dict)
 
 	def eval(self, expr: Expr, constrain_to: Union[type, Tuple[type, ...]] = (Expr, )) -> SQLExpression:
 		if not isinstance(expr, constrain_to):
@@ -50,27 +73,37 @@ class SQLExpressionTranslator:
 		ret = cast(SQLExpression, eval_func(expr))
 		return ret
 
-	def _eval_BinaryOpExpr(self, expr: BinaryOpExpr) -> SQLExpression:
-		lhs = self.eval(expr.lhs)
-		rhs = self.eval(expr.rhs)
+	def eval_operand(self, expr: Expr) -> SQLExpression:
+		ret = self.eval(expr)
+		if isinstance(expr, BinaryOpExpr):
+			return SQLExpression(ret.type, f'({ret.text})', ret.column)
+		return ret
 
+	# operands can come from different translators, e.g. one for each side of a join
+	def eval_binop(self, op: BinaryOp, lhs: SQLExpression, rhs: SQLExpression) -> SQLExpression:
 		if self.conn.rewrite_binop is not None:
 			rewrite_func = self.conn.rewrite_binop
-			ret = rewrite_func(expr.op, lhs, rhs)
+			ret = rewrite_func(op, lhs, rhs)
 			if ret:
 				return ret
 
-		default_symbol = _sql_binop_symbol_overrides.get(expr.op, expr.op.value)
-		symbol = _sql_binop_signature_symbol_overrides.get((expr.op, lhs.type, rhs.type), default_symbol)
+		default_symbol = _sql_binop_symbol_overrides.get(op, op.value)
+		symbol = _sql_binop_signature_symbol_overrides.get((op, lhs.type, rhs.type), default_symbol)
 
-		method = binop_lookup[expr.op]
+		method = binop_lookup[op]
 		_, func = method.resolve([lhs.type, rhs.type], allow_default = False)
 
 		return SQLExpression(func.return_type, f'{lhs.text} {symbol} {rhs.text}')
 
+	def _eval_BinaryOpExpr(self, expr: BinaryOpExpr) -> SQLExpression:
+		return self.eval_binop(expr.op, self.eval_operand(expr.lhs), self.eval_operand(expr.rhs))
+
 	def _eval_IdentExpr(self, expr: IdentExpr) -> SQLExpression:
 		column_value = self.columns[expr.value]
-		return SQLExpression(column_value, expr.value)
+		text = self.column_exprs.get(expr.value, expr.value)
+		if not _column_ref.fullmatch(text):
+			text = f'({text})'
+		return SQLExpression(column_value, text, column = True)
 
 	def _eval_CallExpr(self, expr: CallExpr) -> SQLExpression:
 		arg_details = [self.eval(a) for a in expr.positional_args]
@@ -83,13 +116,19 @@ class SQLExpressionTranslator:
 		# this allows us to use our existing vector methods for type inference
 		# e.g. sum(my_int_col) maps to core.sum(IntVector) -> Int
 		_, func = method.resolve(
-			[a.type if not self.columns.get(a.text) else scalar_to_vector_lookup[a.type] for a in arg_details])
+			[a.type if not a.column else scalar_to_vector_lookup[a.type] for a in arg_details])
 
 		return SQLExpression(func.return_type, f'{func_name}({args})')
 
+	# interpolated values are bound as parameters, so the sql stays the same whatever they are
 	def _eval_InterpolateExpr(self, expr: InterpolateExpr) -> SQLExpression:
 		value = self.env.eval(expr)
-		return SQLExpression(type(value), sql_interpret_value(value))
+		if not isinstance(value, (String, Int, Float, Bool)):
+			raise QryRuntimeError(f'unhandled value for sql: {value}')
+
+		name = f'qry_p{len(self.params)}'
+		self.params[name] = to_py(value)
+		return SQLExpression(type(value), self.conn.param_marker(name))
 
 	_eval_StringLiteral = make_literal_eval(StringLiteral)
 	_eval_IntLiteral = make_literal_eval(IntLiteral)
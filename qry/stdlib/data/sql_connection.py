@@ -1,17 +1,33 @@
-from typing import Optional, Iterable, Any, Dict, Callable, Tuple
+from typing import Optional, Iterable, Iterator, Any, List, Dict, Callable, Tuple, Hashable
 from typing_extensions import Protocol
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from threading import RLock
 
 from qry.common import export
-from qry.lang import BinaryOp
+from qry.lang import BinaryOp, String, Int, Float, Bool
+from qry.runtime import QryRuntimeError
+
+from .sql_pool import ConnectionPool, get_pool
+from .sql_cache import ResultCache
 
 class DBCursor(Protocol):
 	def execute(self, sql: str, parameters: Iterable[Any] = ...) -> 'DBCursor':
 		...
 
+	def executemany(self, sql: str, seq_of_parameters: Iterable[Iterable[Any]]) -> Any:
+		...
+
 	def fetchall(self) -> Any:
 		...
 
+	def fetchmany(self, size: int = ...) -> Any:
+		...
+
+	def close(self) -> None:
+		...
+
 	description: Any
 	rowcount: int
 
@@ -23,10 +39,147 @@ class DBConn(Protocol):
 class SQLExpression:
 	type: type
 	text: str
+	# whether this refers to a whole column, rather than some scalar value
+	column: bool = False
+
+# values bound to the named placeholders of a rendered query
+QueryParams = Dict[str, Any]
+
+_default_column_type_names = {
+	Int: 'bigint',
+	Float: 'double precision',
+	String: 'text',
+	Bool: 'boolean',
+}
 
 @export
 @dataclass
 class Connection:
-	c: DBConn
+	# unset for pooled connections, which only have a db connection while checked out
+	_c: Optional[DBConn]
 	get_table_metadata: Callable[['Connection', str], Dict[str, type]]
 	rewrite_binop: Optional[Callable[[BinaryOp, SQLExpression, SQLExpression], Optional[SQLExpression]]] = None
+	# rows fetched and converted to arrow at a time when collecting results
+	fetch_batch_size: int = 10000
+	# opens a cursor which leaves the result on the server, and only transfers the rows being fetched
+	server_cursor: Optional[Callable[['Connection'], DBCursor]] = None
+	# the planner's row estimate for a query, if the db can give us one
+	estimate_rows: Optional[Callable[['Connection', str, QueryParams], Optional[int]]] = None
+	# collected queries estimated to return at least this many rows use server side cursors
+	# estimating costs an extra round trip per query, so by default (a negative threshold) they never do,
+	# and 0 always uses them without estimating. streamed results always use them
+	server_cursor_threshold: int = -1
+	# fetches a whole result as an arrow table through some faster db specific route
+	# returns None when it can't handle the query, in which case we go through a regular cursor
+	bulk_fetch: Optional[Callable[['Connection', str, QueryParams, Dict[str, type]], Optional[Any]]] = None
+	# parameter marker used by the driver, e.g. ? for sqlite and %s for psycopg2
+	# drivers using %s take named parameters as %(name)s, and need any other % in the query doubled up
+	placeholder: str = '?'
+	# runs a query through a statement prepared on the server, where the db supports them
+	execute_prepared: Optional[Callable[['Connection', DBCursor, str, QueryParams], None]] = None
+	# column types used when creating tables
+	column_type_names: Dict[type, str] = field(default_factory = lambda: dict(_default_column_type_names))
+	# writes batches of rows into an existing table faster than plain inserts
+	bulk_insert: Optional[Callable[['Connection', str, List[str], Iterator[List[Tuple[Any, ...]]]], None]] = None
+	pool: Optional[ConnectionPool] = None
+	# opt in, through cache_results
+	result_cache: Optional[ResultCache] = None
+	# schemas of every table in the db, fetched through a single catalog query
+	get_all_table_metadata: Optional[Callable[['Connection'], Dict[str, Dict[str, type]]]] = None
+	# schemas of tables we've already seen, until refresh_schemas or a ddl statement run through execute
+	schemas: Dict[str, Dict[str, type]] = field(default_factory = dict, repr = False)
+	# renders pipelines into as few selects as possible rather than nesting a subquery per step
+	flatten_queries: bool = True
+	_executor: Optional[ThreadPoolExecutor] = field(default = None, init = False, repr = False, compare = False)
+	# unpooled connections share one db connection between the caller and collect_async's worker, which take turns
+	_lock: Any = field(default_factory = RLock, init = False, repr = False, compare = False)
+	# set on a checked out connection once something may have been left in its db session, e.g. an open transaction
+	# the db connection is then closed rather than going back to the pool, so nothing carries over to its next user
+	session_changed: bool = field(default = False, init = False, repr = False, compare = False)
+
+	@property
+	def c(self) -> DBConn:
+		if self._c is None:
+			raise QryRuntimeError('pooled connections must be checked out before use')
+		return self._c
+
+	# runs queries in the background, at most as many at once as there are db connections to run them on
+	def executor(self) -> ThreadPoolExecutor:
+		if self._executor is None:
+			workers = self.pool.max_size if self.pool else 1
+			self._executor = ThreadPoolExecutor(workers, thread_name_prefix = 'qry-query')
+		return self._executor
+
+	# yields a connection holding its own db connection for the duration, which goes back to the pool afterwards
+	# connections that hit an error are checked before they're reused
+	@contextmanager
+	def checkout(self) -> Iterator['Connection']:
+		if self.pool is None:
+			with self._lock:
+				yield self
+			return
+
+		pool = self.pool
+		c = pool.acquire()
+		checked_out = replace(self, _c = c, pool = None)
+		failed = False
+		try:
+			yield checked_out
+		except BaseException:
+			failed = True
+			raise
+		finally:
+			if checked_out.session_changed:
+				pool.discard(c)
+			else:
+				pool.release(c, check = failed)
+
+	def param_marker(self, name: str) -> str:
+		return f'%({name})s' if self.placeholder == '%s' else f':{name}'
+
+	# text going into a query which is run with parameters
+	def escape_text(self, text: str) -> str:
+		return text.replace('%', '%%') if self.placeholder == '%s' else text
+
+	def query_cursor(self, sql: str, params: QueryParams = {}, stream: bool = False) -> DBCursor:
+		if self.server_cursor is None:
+			return self.c.cursor()
+		if stream:
+			return self.server_cursor(self)
+
+		threshold = self.server_cursor_threshold
+		if threshold < 0:
+			return self.c.cursor()
+
+		if threshold > 0:
+			estimate = self.estimate_rows(self, sql, params) if self.estimate_rows else None
+			if estimate is None or estimate < threshold:
+				return self.c.cursor()
+
+		return self.server_cursor(self)
+
+	# rendered queries are always run with their parameters, even when there are none, so escaping is consistent
+	def run_query(self, cursor: DBCursor, sql: str, params: QueryParams) -> None:
+		if self.execute_prepared is not None and params:
+			self.execute_prepared(self, cursor, sql, params)
+		else:
+			cursor.execute(sql, params)
+
+# connections with the same key share a pool of up to pool_size db connections
+# pooling is opt in, since each execute or collect may then run in a different db session: temp tables, set
+# statements and transactions don't carry over between them. by default (a pool_size of 0) a connection keeps
+# a single db connection of its own
+# one db connection is made up front either way, so bad connection details are reported straight away
+def pooled_connection(
+	key: Hashable,
+	connect: Callable[[], DBConn],
+	pool_size: int,
+	get_table_metadata: Callable[[Connection, str], Dict[str, type]],
+	**kwargs: Any,
+) -> Connection:
+	if pool_size <= 0:
+		return Connection(connect(), get_table_metadata, **kwargs)
+
+	pool = get_pool(key, connect, pool_size)
+	pool.release(pool.acquire())
+	return Connection(None, get_table_metadata, pool = pool, **kwargs)
@@ -0,0 +1,148 @@
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from threading import Condition, Lock
+from time import monotonic
+
+from qry.runtime import QryRuntimeError
+
+def _close_quietly(conn: Any) -> None:
+	try:
+		conn.close()
+	except Exception:
+		pass
+
+def ping_connection(conn: Any) -> bool:
+	try:
+		cursor = conn.cursor()
+		cursor.execute('select 1')
+		cursor.fetchall()
+		cursor.close()
+		return True
+	except Exception:
+		return False
+
+# db connections kept open between uses, so each query doesn't pay for connecting and authenticating again
+# idle connections are handed out most recently used first, so single threaded scripts keep getting the same one back
+class ConnectionPool:
+	connect: Callable[[], Any]
+	max_size: int
+	# idle connections older than this are closed rather than reused
+	max_idle: float
+	# idle connections older than this are pinged before being handed out
+	check_after: float
+	# how long to wait for a connection once max_size are in use
+	timeout: float
+	ping: Callable[[Any], bool]
+
+	idle: List[Tuple[Any, float]]
+	in_use: int
+
+	def __init__(
+		self,
+		connect: Callable[[], Any],
+		max_size: int = 10,
+		max_idle: float = 300.0,
+		check_after: float = 30.0,
+		timeout: float = 30.0,
+		ping: Callable[[Any], bool] = ping_connection,
+	) -> None:
+		self.connect = connect
+		self.max_size = max_size
+		self.max_idle = max_idle
+		self.check_after = check_after
+		self.timeout = timeout
+		self.ping = ping
+
+		self.idle = []
+		self.in_use = 0
+		self._condition = Condition()
+
+	def _evict_idle(self, now: float) -> None:
+		# idle is ordered by last use, so expired connections are all at the front
+		expired = 0
+		while expired < len(self.idle) and now - self.idle[expired][1] > self.max_idle:
+			_close_quietly(self.idle[expired][0])
+			expired += 1
+		del self.idle[:expired]
+
+	# claims a slot in the pool, along with an idle connection to fill it if there is one
+	def _reserve(self) -> Tuple[Optional[Any], float]:
+		deadline = monotonic() + self.timeout
+		with self._condition:
+			while True:
+				now = monotonic()
+				self._evict_idle(now)
+				if self.idle:
+					self.in_use += 1
+					return self.idle.pop()
+
+				if self.in_use < self.max_size:
+					self.in_use += 1
+					return None, now
+
+				if now >= deadline:
+					raise QryRuntimeError(f'timed out waiting for a connection, all {self.max_size} are in use')
+				self._condition.wait(deadline - now)
+
+	def acquire(self) -> Any:
+		while True:
+			conn, last_used = self._reserve()
+			if conn is None:
+				try:
+					return self.connect()
+				except Exception:
+					self.discard(None)
+					raise
+
+			if monotonic() - last_used < self.check_after or self.ping(conn):
+				return conn
+			self.discard(conn)
+
+	# connections released with check set are pinged before they're next handed out
+	def release(self, conn: Any, check: bool = False) -> None:
+		with self._condition:
+			self.in_use -= 1
+			# the pool may have been shrunk since this was handed out
+			if self.in_use + len(self.idle) >= self.max_size:
+				_close_quietly(conn)
+			else:
+				self.idle.append((conn, float('-inf') if check else monotonic()))
+			self._condition.notify()
+
+	def discard(self, conn: Optional[Any]) -> None:
+		if conn is not None:
+			_close_quietly(conn)
+
+		with self._condition:
+			self.in_use -= 1
+			self._condition.notify()
+
+	def close(self) -> None:
+		with self._condition:
+			for conn, _ in self.idle:
+				_close_quietly(conn)
+			self.idle = []
+
+_pools: Dict[Hashable, ConnectionPool] = {}
+_pools_lock = Lock()
+
+# pools are shared by every connection made with the same key, i.e. the same connection parameters
+def get_pool(
+	key: Hashable,
+	connect: Callable[[], Any],
+	max_size: int,
+	ping: Callable[[Any], bool] = ping_connection,
+) -> ConnectionPool:
+	with _pools_lock:
+		pool = _pools.get(key)
+		if pool is None:
+			pool = ConnectionPool(connect, max_size, ping = ping)
+			_pools[key] = pool
+
+		pool.max_size = max_size
+		return pool
+
+def close_pools() -> None:
+	with _pools_lock:
+		for pool in _pools.values():
+			pool.close()
+		_pools.clear()
@@ -0,0 +1,85 @@
+from typing import Any, Callable, Iterator, Optional, Tuple
+from dataclasses import dataclass
+
+import pyarrow
+
+from qry.common import export
+from qry.runtime import QryRuntimeError
+from qry.stdlib.ops import length, num_rows
+
+from .dataframe import col
+from .sql import QueryPipeline
+from .vector import vector_from_array, sum, mean
+
+# streams re-run their query on every pass and only ever hold a single batch,
+# so reductions over them stay within a fixed amount of memory however big the result is
+
+@export
+@dataclass
+class BatchStream:
+	batches: Callable[[], Iterator[pyarrow.RecordBatch]]
+
+	def __iter__(self) -> Iterator[pyarrow.RecordBatch]:
+		return self.batches()
+
+@export
+@dataclass
+class VectorStream:
+	stream: BatchStream
+	name: str
+
+	def arrays(self) -> Iterator[pyarrow.Array]:
+		for batch in self.stream:
+			index = batch.schema.get_field_index(self.name)
+			if index < 0:
+				raise QryRuntimeError(f'no such column: {self.name}')
+			yield batch.column(index)
+
+@export
+def collect_batches(query: QueryPipeline, batch_size: int = 10000) -> BatchStream:
+	return BatchStream(lambda: query.execute_batches(batch_size))
+
+@num_rows
+def stream_num_rows(stream: BatchStream) -> int:
+	ret = 0
+	for batch in stream:
+		ret += batch.num_rows
+	return ret
+
+@col
+def stream_col(stream: BatchStream, name: str) -> VectorStream:
+	return VectorStream(stream, name)
+
+@length
+def vecstream_len(vec: VectorStream) -> int:
+	ret = 0
+	for data in vec.arrays():
+		ret += len(data)
+	return ret
+
+def _sum_and_length(vec: VectorStream) -> Tuple[Any, int]:
+	# each batch is reduced with the regular vector methods, so streams behave exactly like collected vectors
+	total = None
+	count = 0
+	for data in vec.arrays():
+		count += len(data)
+		# batches where every value is null don't get a proper type
+		if data.type == pyarrow.null():
+			continue
+
+		batch_total = sum.call([vector_from_array(data)])
+		if batch_total is not None:
+			total = batch_total if total is None else total + batch_total
+
+	return total, count
+
+@sum
+def vecstream_sum(vec: VectorStream) -> Any:
+	return _sum_and_length(vec)[0]
+
+@mean
+def vecstream_mean(vec: VectorStream) -> Optional[float]:
+	total, count = _sum_and_length(vec)
+	if total is None or count == 0:
+		return None
+	return float(total) / count
@@ -147,12 +147,12 @@ def builtin_to_string(obj: BuiltinFunction) -> str:
 
 @to_string
 def method_to_string(obj: Method) -> str:
-	options = '\n'.join([f'{obj.name}({k})' for k in obj.funcs.keys()])
+	options = '\n'.join([f'{obj.name}({sig})' for sig in obj.signatures()])
 	return f'method {obj.name}(...) with specialisations:\n{options}'
 
 def environment_to_string(obj: Environment) -> str:
 	chain = ' -> '.join([e.name for e in obj.chain()])
-	entries = '\n'.join([f'- ({type(v).__name__}) {k}' for k, v in obj.state.items()])
+	entries = '\n'.join([f'- ({type(v).__name__}) {k}' for k, v in obj.local_items()])
 	return f'{obj.name} (chain: {chain}):\n{entries}'
 
 @to_string
@@ -200,6 +200,8 @@ binop_lookup = {
 	BinaryOp.LESS_THAN_OR_EQUAL: less_than_or_equal,
 	BinaryOp.AND: and_,
 	BinaryOp.OR: or_,
+	BinaryOp.LOGICAL_AND: and_,
+	BinaryOp.LOGICAL_OR: or_,
 }
 
 unop_lookup = {
@@ -0,0 +1,13 @@
+from typing import Any
+import os
+import shutil
+import tempfile
+
+# parsers and the caches behind them are set up as test modules are imported, so this runs before collection
+# pointing the caches at a throwaway dir keeps test runs out of the user's own cache
+def pytest_configure(config: Any) -> None:
+	config.qry_cache_dir = tempfile.mkdtemp(prefix = 'qry-test-cache-')
+	os.environ['QRY_CACHE_DIR'] = config.qry_cache_dir
+
+def pytest_unconfigure(config: Any) -> None:
+	shutil.rmtree(config.qry_cache_dir, ignore_errors = True)
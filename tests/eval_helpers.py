@@ -2,11 +2,11 @@ from typing import Any, List, Tuple, Optional, Callable
 
 import pytest
 
-from qry.lang import Parser
+from qry.lang import ASTCache, Parser
 from qry.interpreter import Interpreter
 from qry.runtime import to_py, QryRuntimeError
 
-parser = Parser()
+parser = ASTCache(Parser())
 
 def data_driven_test(
 	data: List[Tuple[str, Any]],
@@ -0,0 +1,60 @@
+from typing import List
+from pathlib import Path
+
+from qry.lang import ASTCache, Parser, Optimiser, Expr
+from qry.stdlib.ops import binop_lookup, unop_lookup
+
+source = '''
+x <- 1 + 2
+fn add(a: Int, b: Int) -> Int { a + b }
+x |> add(1)
+'''
+
+class CountingParser(Parser):
+	calls: int = 0
+
+	def parse(self, text: str) -> List[Expr]:
+		self.calls += 1
+		return super().parse(text)
+
+def test_cache_hit(tmp_path: Path) -> None:
+	parser = CountingParser()
+	cache = ASTCache(parser, cache_dir = tmp_path)
+
+	first = cache.parse(source)
+	second = ASTCache(parser, cache_dir = tmp_path).parse(source)
+	assert first == second == Parser().parse(source)
+	assert parser.calls == 1
+
+	cache.parse(source + '\nx')
+	assert parser.calls == 2
+
+def test_optimised_entries_kept_apart(tmp_path: Path) -> None:
+	parser = CountingParser()
+	optimiser = Optimiser(binop_lookup, unop_lookup)
+
+	parsed = ASTCache(parser, cache_dir = tmp_path).parse(source)
+	optimised = ASTCache(parser, optimiser, cache_dir = tmp_path).parse(source)
+	assert optimised == optimiser.optimise(parsed)
+	assert optimised != parsed
+
+	assert ASTCache(parser, optimiser, cache_dir = tmp_path).parse(source) == optimised
+	assert parser.calls == 2
+
+def test_corrupt_entry_reparsed(tmp_path: Path) -> None:
+	parser = CountingParser()
+	cache = ASTCache(parser, cache_dir = tmp_path)
+	cache.parse(source)
+
+	for path in tmp_path.glob('ast/*.ast'):
+		path.write_bytes(b'garbage')
+
+	assert cache.parse(source) == Parser().parse(source)
+	assert parser.calls == 2
+
+def test_cache_disabled(tmp_path: Path) -> None:
+	parser = CountingParser()
+	cache = ASTCache(parser, cache_dir = None)
+	cache.parse(source)
+	cache.parse(source)
+	assert parser.calls == 2
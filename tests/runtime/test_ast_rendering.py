@@ -3,6 +3,7 @@ from ..eval_helpers import data_driven_test
 test_syntax = data_driven_test([
 	('to_string(get_ast(1 + 1 + 3))', '((1 + 1) + 3)'),
 	('to_string(get_ast(!true))', '!true'),
+	('to_string(get_ast(a && b || c))', '((a && b) || c)'),
 	('to_string(get_ast(null))', 'null'),
 	('to_string(get_ast(my_ident))', 'my_ident'),
 	('to_string(get_ast("some_string"))', '"some_string"'),
@@ -0,0 +1,20 @@
+import pickle
+
+import pytest
+
+from qry.lang import Int, Float, String, Bool, Null
+
+def test_singletons() -> None:
+	assert Bool(True) is Bool(True)
+	assert Bool(False) is not Bool(True)
+	assert Null() is Null()
+	assert Int(1) is Int(1)
+	assert Int(100000) == Int(100000)
+
+@pytest.mark.parametrize("value", [Int(1), Int(100000), Float(1.5), String("hi"), Bool(True), Null()])
+def test_scalar_pickling(value: object) -> None:
+	assert pickle.loads(pickle.dumps(value)) == value
+
+def test_scalars_are_immutable() -> None:
+	with pytest.raises(AttributeError):
+		Int(1).val = 2 # type: ignore
@@ -23,6 +23,51 @@ expressions_with_results = [
 
 	named_add(1, 2)
 	''', 3),
+	('''
+	fn add_two(x: Int) -> Int {
+		x + 2
+	}
+
+	fn add_one(x: Int) -> Int {
+		x |> add_two() - 1
+	}
+
+	add_one(1) + add_one(2)
+	''', 5),
+	('''
+	fn uses_later_definition(x: Int) -> Int {
+		defined_later(x)
+	}
+
+	fn defined_later(x: Int) -> Int {
+		x * 10
+	}
+
+	uses_later_definition(2)
+	''', 20),
+	('''
+	bonus <- 1
+	fn make_total(x: Int) -> Int {
+		doubled <- x * 2
+		add_bonus <- fn(y: Int) -> Int {
+			y + doubled + bonus
+		}
+		add_bonus(x)
+	}
+
+	first <- make_total(1)
+	bonus <- 100
+	first + make_total(1)
+	''', 107),
+	('''
+	x <- 1
+	fn shadow(y: Int) -> Int {
+		x <- y
+		x
+	}
+
+	shadow(5) + x
+	''', 6),
 ]
 
 test_functions = data_driven_test(expressions_with_results)
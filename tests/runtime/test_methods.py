@@ -1,5 +1,8 @@
+from typing import Any
+
+from qry.lang import Int, String
 from qry.interpreter import Interpreter
-from qry.runtime import QryRuntimeError
+from qry.runtime import QryRuntimeError, MethodCallSite, method
 
 from ..eval_helpers import data_driven_test
 from .data import methodlib
@@ -17,5 +20,26 @@ test_methods = data_driven_test([
 	('generic_dispatch(Int)', 'special int'),
 	('generic_dispatch(Float)', 'Float'),
 	('generic_dispatch(String)', 'String'),
+	('my_mul_func(2, arg2 = 3)', 6),
+	('my_mul_func(arg2 = 3, arg1 = 2)', 6),
+	('my_mul_func(2, arg3 = 3)', QryRuntimeError('unknown argument: arg3')),
+	('my_mul_func(2, arg1 = 3)', QryRuntimeError('multiple values for argument: arg1')),
+	('str_or_int_method(obj = 1)', QryRuntimeError('methods only take positional arguments')),
 ],
 	init = init_interpreter)
+
+def test_method_call_site_invalidation() -> None:
+	@method
+	def late_method(obj: Any) -> Any:
+		return 'fallback'
+
+	site = MethodCallSite(late_method)
+	assert site.call([Int(1)]) == 'fallback'
+
+	@late_method
+	def late_method_int(obj: Int) -> Any:
+		return 'int'
+
+	assert site.call([Int(1)]) == 'int'
+	assert late_method.call([Int(1)]) == 'int'
+	assert late_method.call([String('')]) == 'fallback'
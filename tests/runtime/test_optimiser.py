@@ -0,0 +1,76 @@
+from typing import Any
+
+import pytest
+
+from qry.lang import Parser, Optimiser
+from qry.interpreter import Interpreter
+from qry.runtime import to_py
+from qry.stdlib.ops import binop_lookup, unop_lookup
+
+parser = Parser()
+optimiser = Optimiser(binop_lookup, unop_lookup)
+
+optimised_renders = [
+	('1 + 2 * 3', '7'),
+	('-1', '-1'),
+	('1.5 + 1', '2.5'),
+	('"ohai" + ", " + "world"', '"ohai, world"'),
+	('1 < 2', 'true'),
+	('false && x', 'false'),
+	('true || x', 'true'),
+	('true && x', '(true && x)'),
+	('!(1 == 2)', 'true'),
+	('x + 1 * 2', '(x + 2)'),
+	('1 + "nope"', '(1 + "nope")'),
+	('x |> f(1) |> g()', 'g(f(x, 1))'),
+	('x |> f(1 + 1, named = 2 * 2)', 'f(x, (1 + 1), named = (2 * 2))'),
+	('get_ast(1 + 2)', 'get_ast((1 + 2))'),
+	('(1 + 2) |> f()', 'f((1 + 2))'),
+	('f(x |> g())', 'f((x |> g()))'),
+	('fn(x: Int) -> Int { unused <- 1 + 1 \n x }', 'fn(x: Int) -> Int { x }'),
+	('fn(x: Int) -> Int { unused <- x + 1 \n x }', 'fn(x: Int) -> Int { (x + 1) x }'),
+	('fn(x: Int) -> Int { unused <- x |> f() \n x }', 'fn(x: Int) -> Int { f(x) x }'),
+	('fn(x: Int) -> Int { used <- x \n used + 1 }', 'fn(x: Int) -> Int { (used <- x) (used + 1) }'),
+	('fn(x: Int) -> Int { a <- b <- x \n a }', 'fn(x: Int) -> Int { (a <- x) a }'),
+	('fn(x: Int) -> Int { unused <- 1 }', 'fn(x: Int) -> Int { 1 }'),
+	('fn(x: Int) -> Int { use data \n unused <- 1 \n x }', 'fn(x: Int) -> Int { use data (unused <- 1) x }'),
+	('unused <- 1', '(unused <- 1)'),
+]
+
+@pytest.mark.parametrize("source, expected", optimised_renders)
+def test_optimised_render(source: str, expected: str) -> None:
+	exprs = optimiser.optimise(parser.parse(source))
+	assert ' '.join([e.render() for e in exprs]) == expected
+
+def test_optimise_preserves_original() -> None:
+	exprs = parser.parse('x |> f(1)')
+	optimiser.optimise(exprs)
+	assert exprs[0].render() == '(x |> f(1))'
+
+@pytest.mark.parametrize("source", [
+	'''
+	fn add_twice(x: Int) -> Int {
+		unused <- x * 100
+		step <- x + 1
+		step |> add_one() + 1 - 1
+	}
+	fn add_one(x: Int) -> Int { x + 1 }
+	add_twice(1) + add_twice(10 * 2)
+	''',
+	'(1 + 2) * 3 - 4 / 2.0',
+])
+def test_optimised_eval(source: str) -> None:
+	def run(optimise: bool) -> Any:
+		exprs = parser.parse(source)
+		if optimise:
+			exprs = optimiser.optimise(exprs)
+		interpreter = Interpreter()
+		return [to_py(interpreter.eval(e)) for e in exprs][-1]
+
+	assert run(True) == run(False)
+
+def test_optimise_keeps_lazy_args() -> None:
+	interpreter = Interpreter()
+	interpreter.eval(parser.parse('use meta::*')[0])
+	exprs = optimiser.optimise(parser.parse('to_string(get_ast(1 + 2))'))
+	assert to_py(interpreter.eval(exprs[0])) == '(1 + 2)'
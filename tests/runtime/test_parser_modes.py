@@ -0,0 +1,60 @@
+from glob import glob
+from pathlib import Path
+
+import pytest
+from lark.exceptions import UnexpectedInput
+
+from qry.lang import Parser
+from qry.lang.parser import _get_lark_parser
+
+# spread over lines so that mismatched source info shows up
+source = '''
+x <- 1 + 2 *
+	3
+fn
+add(
+	a: Int,
+	b: Int,
+) -> Int {
+	a + b
+}
+fn(
+) -> Null {
+	null
+}
+(
+	x
+) |> add(1) -> y
+print(sep = ", ", "a",
+	"b")
+{{
+	y > 2 && true || !false
+}}
+use
+	data::*
+use core::{print,
+	length}
+-2.5
+'''
+
+def _parse_both(text: str) -> None:
+	inline = Parser().parse(text)
+	tree = Parser(build_tree = True).parse(text)
+	assert inline == tree
+	assert [e.source for e in inline] == [e.source for e in tree]
+
+def test_inline_parse_matches_tree() -> None:
+	_parse_both(source)
+
+@pytest.mark.parametrize("filename", glob('tests/code/**/*.qry', recursive = True))
+def test_inline_parse_matches_tree_for_code_files(filename: str) -> None:
+	_parse_both(Path(filename).read_text())
+
+def test_inline_parse_keeps_no_lines_between_parses() -> None:
+	parser = _get_lark_parser(build_tree = False)
+	Parser().parse(source)
+	assert parser._lines == {}
+
+	with pytest.raises(UnexpectedInput):
+		Parser().parse('x <- (1 +\n2')
+	assert parser._lines == {}
@@ -0,0 +1,30 @@
+from pathlib import Path
+
+from lark import Lark
+
+from qry.lang.parser import write_parser_tables, _read_tables, _tables_key, _lark_namespace, _get_lark_parser
+
+source = '''
+x <- 1 + 2 * 3
+fn add(a: Int, b: Int) -> Int { a + b }
+x |> add(1) -> y
+'''
+
+def test_serialised_tables(tmp_path: Path) -> None:
+	tables_path = tmp_path / 'grammar.tables'
+	write_parser_tables(tables_path)
+
+	grammar = Path('qry/lang/grammar.lark').read_text()
+	tables = _read_tables(tables_path, _tables_key(grammar))
+	assert tables
+
+	parser = Lark.deserialize(tables['data'], _lark_namespace, tables['memo'])
+	assert parser.parse(source) == _get_lark_parser(build_tree = True).parse(source)
+
+def test_stale_tables_ignored(tmp_path: Path) -> None:
+	tables_path = tmp_path / 'grammar.tables'
+	write_parser_tables(tables_path)
+	assert _read_tables(tables_path, 'some other grammar') is None
+
+	tables_path.write_bytes(b'garbage')
+	assert _read_tables(tables_path, _tables_key(Path('qry/lang/grammar.lark').read_text())) is None
@@ -0,0 +1,74 @@
+from typing import Any, List
+
+import pytest
+
+from qry.lang import Parser
+from qry.interpreter import Interpreter
+from qry.runtime import QryRuntimeError, to_py
+
+parser = Parser()
+
+def run(interpreter: Interpreter, source: str) -> List[Any]:
+	return [to_py(interpreter.eval(e)) for e in parser.parse(source)]
+
+def test_forks_are_isolated() -> None:
+	interpreter = Interpreter()
+	run(interpreter, '''
+	base <- 10
+	fn add_base(x: Int) -> Int { x + base }
+	''')
+
+	snapshot = interpreter.snapshot()
+	first = snapshot.fork()
+	second = snapshot.fork()
+
+	assert run(first, 'base <- 1\nadd_base(1)') == [1, 11]
+	assert run(second, 'add_base(2)') == [12]
+	assert run(second, 'base') == [10]
+	assert run(interpreter, 'base') == [10]
+
+	run(first, 'use data::*')
+	assert run(first, 'intvec(1) |> sum()') == [1]
+	with pytest.raises(QryRuntimeError, match = 'not found: intvec'):
+		run(second, 'intvec(1)')
+
+def test_snapshotted_interpreter_keeps_going() -> None:
+	interpreter = Interpreter()
+	run(interpreter, 'x <- 1')
+
+	fork = interpreter.fork()
+	run(interpreter, 'x <- 2')
+	assert run(interpreter, 'x') == [2]
+	assert run(fork, 'x') == [1]
+
+def test_fork_libraries_are_copy_on_write() -> None:
+	from .data import methodlib
+
+	interpreter = Interpreter()
+	fork = interpreter.fork()
+	fork.load_library(methodlib, True)
+
+	assert run(fork, 'str_or_int_method(1)') == [False]
+	with pytest.raises(QryRuntimeError, match = 'not found: str_or_int_method'):
+		run(interpreter, 'str_or_int_method(1)')
+	assert 'methodlib' not in interpreter.library_env.state
+
+def test_forking_repeatedly_reuses_the_snapshot() -> None:
+	interpreter = Interpreter()
+	run(interpreter, 'x <- 1')
+
+	forks = [interpreter.fork() for _ in range(100)]
+	depth = len(interpreter.global_env.chain())
+	assert len(forks[-1].global_env.chain()) == depth
+	assert len(interpreter.fork().global_env.chain()) == depth
+
+	# only defining something in between needs a new layer
+	run(interpreter, 'x <- 2')
+	fork = interpreter.fork()
+	assert len(interpreter.global_env.chain()) == depth + 1
+	assert run(fork, 'x') == [2]
+	assert run(forks[0], 'x') == [1]
+
+	from .data import methodlib
+	interpreter.load_library(methodlib, False)
+	assert 'methodlib' in interpreter.fork().library_env.state
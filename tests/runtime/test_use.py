@@ -1,3 +1,6 @@
+from qry.lang import Parser
+from qry.interpreter import Interpreter
+from qry.interpreter.interpreter import _build_stdlib_snapshot
 from qry.runtime import QryRuntimeError
 
 from ..eval_helpers import data_driven_test
@@ -19,3 +22,18 @@ test_syntax = data_driven_test([
 	intvec(1) |> sum()
 	''', QryRuntimeError('not found: sum')),
 ])
+
+def test_libraries_load_lazily() -> None:
+	# the default stdlib is shared by the whole process, so other tests may already have loaded data
+	interpreter = Interpreter(_build_stdlib_snapshot())
+	data = interpreter.library_env.state['data']
+	meta = interpreter.library_env.state['meta']
+	assert not data.loaded and not meta.loaded
+
+	for expr in Parser().parse('1 + 2'):
+		interpreter.eval(expr)
+	assert not data.loaded
+
+	for expr in Parser().parse('use data\ndata::intvec(1)'):
+		interpreter.eval(expr)
+	assert data.loaded and not meta.loaded
@@ -0,0 +1,26 @@
+from typing import Any, List
+
+from qry.interpreter import Interpreter
+from qry.stdlib.data.sql import QueryPipeline
+
+from .eval_helpers import parser
+
+# a couple of small sqlite tables to build queries over
+sample_tables = '''
+use data::*
+conn <- connect_sqlite(":memory:")
+execute(conn, "create table people (name text, age integer, city text)")
+execute(conn, "insert into people values ('ruan', 26, 'cpt'), ('ruanlater', 27, 'jhb'), ('thirdperson', 27, 'cpt')")
+execute(conn, "create table cities (city text, country text)")
+execute(conn, "insert into cities values ('cpt', 'za'), ('jhb', 'za'), ('ldn', 'uk')")
+people <- get_table(conn, "people")
+cities <- get_table(conn, "cities")
+min_age <- 27
+'''
+
+# the query pipeline the given source evaluates to, over the sample tables
+def sample_query(source: str) -> QueryPipeline:
+	interpreter = Interpreter()
+	results: List[Any] = [interpreter.eval(e) for e in parser.parse(sample_tables + source)]
+	assert isinstance(results[-1], QueryPipeline)
+	return results[-1]
@@ -0,0 +1,79 @@
+from typing import Any, Dict, IO, List, Tuple
+import re
+
+import pytest
+
+import pyarrow
+
+from qry.lang import Int, String, Bool, Float
+from qry.stdlib.data.db_postgres import _postgres_copy_fetch, _postgres_copy_insert
+from qry.stdlib.data.sql_connection import Connection
+
+class FakeCopyCursor:
+	def __init__(self, output: bytes) -> None:
+		self.output = output
+		self.sql = ''
+
+	def mogrify(self, sql: str, params: Dict[str, Any]) -> bytes:
+		return (sql % {name: repr(value) for name, value in params.items()}).encode()
+
+	def copy_expert(self, sql: str, f: IO[Any]) -> None:
+		if not self.output:
+			raise Exception('copy failed')
+		self.sql = sql
+		if 'from stdin' in sql:
+			self.output += f.read().encode()
+		else:
+			# <null> stands for whatever null marker the copy asked for
+			null_marker = re.search(r"null '([^']*)'", sql).group(1) # type: ignore
+			f.write(self.output.replace(b'<null>', null_marker.encode()))
+
+	def close(self) -> None:
+		pass
+
+class FakeConn:
+	def __init__(self, output: bytes) -> None:
+		self.copy_cursor = FakeCopyCursor(output)
+
+	def cursor(self) -> Any:
+		return self.copy_cursor
+
+def _fetch(output: bytes, columns: Any) -> Any:
+	conn = Connection(FakeConn(output), lambda conn, table: {}) # type: ignore
+	return _postgres_copy_fetch(conn, 'select %(qry_p0)s', {'qry_p0': 1}, columns)
+
+def test_copy_parses_typed_columns() -> None:
+	output = b'id,name,active,score\n1,"",t,1.5\n<null>,<null>,f,NaN\n'
+	table = _fetch(output, {'id': Int, 'Name': String, 'active': Bool, 'score': Float})
+
+	assert table.schema.types == [pyarrow.int64(), pyarrow.string(), pyarrow.bool_(), pyarrow.float64()]
+	assert table.column('id').to_pylist() == [1, None]
+	assert table.column('name').to_pylist() == ['', None]
+	assert table.column('active').to_pylist() == [True, False]
+
+def test_copy_keeps_null_like_strings() -> None:
+	output = b'name\n"\\N"\n\\N\nNULL\n<null>\n'
+	table = _fetch(output, {'name': String})
+	assert table.column('name').to_pylist() == ['\\N', '\\N', 'NULL', None]
+
+def test_copy_falls_back() -> None:
+	# only a type we can't parse into falls back, since that's known before the query runs
+	assert _fetch(b'id\n1\n', {'id': object}) is None
+
+	# a failing query isn't run a second time through a cursor
+	with pytest.raises(Exception, match = 'copy failed'):
+		_fetch(b'', {'id': Int})
+
+	# unexpected values and columns we know nothing about get their types inferred instead
+	table = _fetch(b'id,other\nabc,2\n', {'id': Int})
+	assert table.to_pydict() == {'id': ['abc'], 'other': [2]}
+
+def test_copy_insert_escapes_values() -> None:
+	fake_conn = FakeConn(b'-')
+	conn = Connection(fake_conn, lambda conn, table: {}) # type: ignore
+	batches: List[List[Tuple[Any, ...]]] = [[(1, 'a\tb', True)], [(None, '', False), (2, None, None)]]
+	_postgres_copy_insert(conn, 'people', ['id', 'name', 'active'], iter(batches))
+
+	cursor = fake_conn.copy_cursor
+	assert cursor.sql == 'copy people (id, name, active) from stdin'
+	assert cursor.output == b'-1\ta\\tb\tt\n\\N\t\tf\n2\t\\N\t\\N\n'
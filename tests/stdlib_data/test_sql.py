@@ -6,6 +6,8 @@ from qry.runtime import QryRuntimeError
 
 from ..eval_helpers import data_driven_test
 
+sql_bootstrap_csv = 'tests/stdlib_data/data/sql_bootstrap.csv'
+
 run_id = str(uuid4()).replace('-', '')
 
 def table_name(name: str) -> str:
@@ -49,6 +51,12 @@ data_exprs = [
 		|> num_rows()
 	''', 1),
 	(f'''
+	get_table(conn, "{table_name('my_table')}")
+		|> filter(name == "ruan" || age == 27 && name == "thirdperson")
+		|> collect()
+		|> num_rows()
+	''', 2),
+	(f'''
 	get_table(conn, "{table_name('my_table')}")
 		|> mutate(next_year = age + 1)
 		|> filter(next_year == 27)
@@ -84,6 +92,82 @@ data_exprs = [
 		|> collect()
 		|> num_rows()
 	''', 1),
+	(f'''
+	get_table(conn, "{table_name('my_table')}")
+		|> collect_batches(batch_size = 2)
+		|> num_rows()
+	''', 3),
+	(f'''
+	get_table(conn, "{table_name('my_table')}")
+		|> collect_batches(batch_size = 2)
+		|> col("age")
+		|> sum()
+	''', 26 + 27 + 27),
+	(f'''
+	get_table(conn, "{table_name('my_table')}")
+		|> filter(age > 26)
+		|> collect_batches()
+		|> col("age")
+		|> mean()
+	''', 27.0),
+	(f'''
+	get_table(conn, "{table_name('my_table')}")
+		|> filter(age > 26)
+		|> collect_async()
+		|> await()
+		|> num_rows()
+	''', 2),
+	(f'''
+	young <- get_table(conn, "{table_name('my_table')}") |> filter(age <= 26) |> collect_async()
+	old <- get_table(conn, "{table_name('my_table')}") |> filter(age > 26) |> collect_async()
+	gather(young, old)
+	(await(young) |> num_rows()) * 10 + (await(old) |> num_rows())
+	''', 12),
+	(f'''
+	write_table(conn, read_csv("{sql_bootstrap_csv}"), "{table_name('written')}")
+	''', 3),
+	(f'''
+	get_table(conn, "{table_name('written')}")
+		|> collect()
+		|> col("age")
+		|> sum()
+	''', 26 + 27 + 27),
+	(f'''
+	write_table(conn, read_csv("{sql_bootstrap_csv}"), "{table_name('written')}")
+	get_table(conn, "{table_name('written')}") |> collect() |> num_rows()
+	''', 6),
+	(f'''
+	write_table(conn, read_csv("{sql_bootstrap_csv}"), "{table_name('written')}", mode = "replace", batch_size = 1)
+	get_table(conn, "{table_name('written')}") |> collect() |> num_rows()
+	''', 3),
+	(f'''
+	write_table(conn, read_csv("{sql_bootstrap_csv}"), "{table_name('written')}", mode = "upsert")
+	''', QryRuntimeError('unknown write mode: upsert')),
+	(f'''
+	conn <- cache_results(conn)
+	write_table(conn, read_csv("{sql_bootstrap_csv}"), "{table_name('cached')}")
+	query <- get_table(conn, "{table_name('cached')}") |> filter(age > 26)
+	first <- query |> collect() |> num_rows()
+	second <- query |> collect() |> num_rows()
+	execute(conn, "delete from {table_name('cached')} where name = 'thirdperson'")
+	third <- query |> collect() |> num_rows()
+	assert(first == 2 && second == 2 && third == 1)
+	cache_hits(conn) * 10 + cache_misses(conn)
+	''', 12),
+	(f'''
+	prefetch_schemas(conn, "{table_name('my_table')}", "{table_name('missing')}")
+	''', 1),
+	(f'''
+	prefetch_schemas(conn)
+	get_table(conn, "{table_name('my_table')}") |> collect() |> num_rows()
+	''', 3),
+	(f'''
+	execute(conn, "create table {table_name('altered')} (a integer)")
+	get_table(conn, "{table_name('altered')}") |> collect() |> num_cols()
+	execute(conn, "drop table {table_name('altered')}")
+	execute(conn, "create table {table_name('altered')} (a integer, b integer)")
+	get_table(conn, "{table_name('altered')}") |> collect() |> num_cols()
+	''', 2),
 ]
 
 def data_test(connect_code: str) -> Any:
@@ -0,0 +1,63 @@
+from typing import Any, Dict, List
+
+import pytest
+
+from qry.runtime import QryRuntimeError
+
+from ..sql_helpers import sample_query
+
+ordered = [
+	('people |> arrange(age, desc = true) |> arrange(city) |> select(name)', {
+		'name': ['thirdperson', 'ruan', 'ruanlater'],
+	}),
+	('people |> arrange(name, desc = true) |> head(2) |> select(name, age)', {
+		'name': ['thirdperson', 'ruanlater'],
+		'age': [27, 27],
+	}),
+	('people |> arrange(age) |> arrange(city) |> head(2) |> arrange(name, desc = true) |> select(name)', {
+		'name': ['thirdperson', 'ruan'],
+	}),
+	('people |> aggregate(group(city), total = sum(age)) |> arrange(total, desc = true) |> head(1)', {
+		'city': ['cpt'],
+		'total': [53],
+	}),
+	('people |> arrange(age) |> inner_join(cities, city) |> select(name, country) |> head(1)', {
+		'name': ['ruan'],
+		'country': ['za'],
+	}),
+	('cities |> anti_join(people |> arrange(age) |> head(1), city) |> arrange(city)', {
+		'city': ['jhb', 'ldn'],
+		'country': ['za', 'uk'],
+	}),
+]
+
+@pytest.mark.parametrize('source, expected', ordered)
+@pytest.mark.parametrize('flatten', [True, False])
+def test_ordered_results(source: str, expected: Dict[str, List[Any]], flatten: bool) -> None:
+	query = sample_query(source)
+	assert query._fetch(query._render_query(flatten)).table.to_pydict() == expected
+
+def test_top_n_sql() -> None:
+	query = sample_query(
+		'people |> filter(age > 20) |> arrange(age, desc = true) |> arrange(city) |> head(2) |> select(name)')
+	assert query._render_query().query == (
+		'select qry_1.name from people qry_1 where qry_1.age > 20 order by qry_1.city, qry_1.age desc limit 2')
+
+	# filtering the rows a limit kept needs a subquery, which only needs the order to pick those rows
+	query = sample_query('people |> arrange(age) |> head(2) |> filter(city == "cpt") |> head(1)')
+	assert query._render_query().query == (
+		'select qry_2.name, qry_2.age, qry_2.city from ('
+		'select qry_1.name, qry_1.age, qry_1.city from people qry_1 order by qry_1.age limit 2'
+		') qry_2 where qry_2.city = \'cpt\' order by qry_2.age limit 1')
+
+	# rows being aggregated don't need sorting
+	query = sample_query('people |> arrange(age) |> aggregate(group(city), total = sum(age))')
+	assert query._render_query().query == (
+		'select qry_1.city, sum(qry_1.age) as total from people qry_1 group by qry_1.city')
+
+def test_arrange_and_head_args() -> None:
+	with pytest.raises(QryRuntimeError, match = 'non-negative'):
+		sample_query('people |> head(-1)')
+
+	with pytest.raises(QryRuntimeError, match = 'expected expr of type'):
+		sample_query('people |> arrange(age + 1)')._render_query()
@@ -0,0 +1,51 @@
+from typing import Any
+
+import pyarrow
+
+from qry.stdlib.data.sql_cache import ResultCache
+
+def _table(rows: int) -> Any:
+	return pyarrow.table({'a': list(range(rows))})
+
+def test_evicts_least_recently_used() -> None:
+	table = _table(100)
+	size = table.nbytes * 2
+	cache = ResultCache(size, 0)
+
+	cache.put('a', table, 0)
+	cache.put('b', table, 0)
+	assert cache.get('a') is table
+
+	cache.put('c', table, 0)
+	assert cache.get('b') is None
+	assert cache.get('a') is table
+	assert cache.get('c') is table
+	assert cache.size == size
+	assert (cache.hits, cache.misses) == (3, 1)
+
+def test_skips_results_bigger_than_the_cache() -> None:
+	cache = ResultCache(10, 0)
+	cache.put('a', _table(100), 0)
+	assert cache.get('a') is None
+	assert cache.size == 0
+
+def test_expires_results() -> None:
+	cache = ResultCache(1024 * 1024, -1)
+	cache.put('a', _table(1), 0)
+	assert cache.get('a') is not None
+
+	cache.ttl = 1e-9
+	cache.put('a', _table(1), 0)
+	assert cache.get('a') is None
+	assert cache.size == 0
+
+def test_invalidation_drops_results_of_running_queries() -> None:
+	cache = ResultCache(1024 * 1024, 0)
+	cache.put('a', _table(1), cache.generation)
+
+	generation = cache.generation
+	cache.invalidate()
+	assert cache.get('a') is None
+
+	cache.put('a', _table(1), generation)
+	assert cache.get('a') is None
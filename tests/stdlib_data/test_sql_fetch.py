@@ -0,0 +1,88 @@
+from typing import Any, Dict, List, Optional, cast
+import sqlite3
+
+import pyarrow
+
+from qry.lang import Int, Float, String
+from qry.stdlib.data.sql import fetch_table
+from qry.stdlib.data.sql_connection import Connection, DBConn, DBCursor
+
+# sqlite3's stubs are stricter than the DB-API protocols the fetch code is written against
+def _cursor(sql: str) -> DBCursor:
+	conn = sqlite3.connect(':memory:')
+	conn.execute('create table t (a integer, b text, c real)')
+	conn.executemany('insert into t values (?, ?, ?)', [
+		(None, 'x', 1.5),
+		(None, None, 2.5),
+		(3, 'z', 3.5),
+		(4, 'w', 4.5),
+		(5, 'v', 5.5),
+	])
+	return cast(DBCursor, conn.execute(sql))
+
+def test_fetch_in_batches() -> None:
+	table = fetch_table(_cursor('select a, b, c from t'), {'a': Int, 'b': String, 'c': Float}, 2)
+
+	assert table.column_names == ['a', 'b', 'c']
+	assert table.schema.types == [pyarrow.int64(), pyarrow.string(), pyarrow.float64()]
+	assert table.column('a').num_chunks == 3
+	assert table.to_pydict() == {
+		'a': [None, None, 3, 4, 5],
+		'b': ['x', None, 'z', 'w', 'v'],
+		'c': [1.5, 2.5, 3.5, 4.5, 5.5],
+	}
+
+def test_fetch_infers_unknown_and_mismatched_types() -> None:
+	# a is all null in the first batch, and c doesn't match the type we were told to expect
+	table = fetch_table(_cursor('select a, c from t'), {'C': String}, 2)
+	assert table.schema.types == [pyarrow.int64(), pyarrow.float64()]
+	assert table.to_pydict() == {'a': [None, None, 3, 4, 5], 'c': [1.5, 2.5, 3.5, 4.5, 5.5]}
+
+def test_fetch_empty_result() -> None:
+	table = fetch_table(_cursor('select a, b from t where a > 100'), {'a': Int}, 2)
+	assert table.num_rows == 0
+	assert table.schema.types == [pyarrow.int64(), pyarrow.null()]
+
+def test_server_cursor_threshold() -> None:
+	server_cursors: List[Any] = []
+	estimates: List[Optional[int]] = [None]
+	estimated: List[str] = []
+
+	def server_cursor(conn: Connection) -> DBCursor:
+		cursor = conn.c.cursor()
+		server_cursors.append(cursor)
+		return cursor
+
+	def estimate_rows(conn: Connection, sql: str, params: Dict[str, Any]) -> Optional[int]:
+		estimated.append(sql)
+		return estimates[0]
+
+	conn = Connection(
+		cast(DBConn, sqlite3.connect(':memory:')),
+		lambda conn, table: {},
+		server_cursor = server_cursor,
+		estimate_rows = estimate_rows)
+
+	# by default collected queries don't pay for an estimate, and only streamed ones use server cursors
+	estimates[0] = 10 ** 9
+	conn.query_cursor('select 1')
+	assert len(server_cursors) == 0
+	assert conn.query_cursor('select 1', stream = True) is server_cursors[-1]
+	assert estimated == []
+
+	# no estimate, or a small one, sticks with regular cursors
+	conn.server_cursor_threshold = 100
+	estimates[0] = None
+	conn.query_cursor('select 1')
+	estimates[0] = 99
+	conn.query_cursor('select 1')
+	assert len(server_cursors) == 1
+
+	estimates[0] = 100
+	assert conn.query_cursor('select 1') is server_cursors[-1]
+
+	conn.server_cursor_threshold = 0
+	estimates[0] = None
+	conn.query_cursor('select 1')
+	assert len(server_cursors) == 3
+	assert len(estimated) == 3
@@ -0,0 +1,74 @@
+from typing import Any, List
+
+import pytest
+
+from ..sql_helpers import sample_query
+
+pipelines = [
+	'people |> filter(age >= {{min_age}}) |> filter(city == "cpt" || name == "ruan")',
+	'people |> mutate(next_year = age + 1) |> filter(next_year > 27) |> select(name, next_year)',
+	'people |> mutate(double = age * 2) |> filter(double > 53) |> mutate(quad = double * 2)',
+	'people |> filter(age > 26) |> aggregate(group(city), total = sum(age)) |> filter(total > 20)',
+	'people |> aggregate(group(city), total = sum(age)) |> mutate(double = total * 2) |> filter(double > 60)'
+	' |> select(city, double)',
+	'people |> aggregate(group(city), total = sum(age)) |> mutate(double = total * 2)'
+	' |> aggregate(group(), n = sum(double))',
+	'people |> select(city) |> cross_join(cities |> filter(country == "za") |> select(country))',
+	'people |> cross_join(cities |> aggregate(group(country), n = sum(1)))',
+	'people |> left_join(cities |> mutate(k = 1), city, age > 26) |> select(name, k)',
+	'people |> left_join(cities |> mutate(place = city) |> select(city, place), city, age > 26) |> select(name, place)',
+]
+
+@pytest.mark.parametrize('source', pipelines)
+def test_flattened_results_match_nested(source: str) -> None:
+	query = sample_query(source)
+	flat = query._fetch(query._render_query(flatten = True)).table
+	nested = query._fetch(query._render_query(flatten = False)).table
+
+	def rows(table: Any) -> List[Any]:
+		return sorted(zip(*[table.column(n).to_pylist() for n in flat.column_names]))
+
+	assert rows(flat) == rows(nested)
+	assert len(rows(flat))
+
+def test_flattened_sql() -> None:
+	query = sample_query(
+		'people |> mutate(next_year = age + 1) |> filter(next_year > {{min_age}}) '
+		'|> filter(city == "cpt") |> select(name)')
+	assert query._render_query().query == (
+		'select qry_1.name from people qry_1 where ((qry_1.age + 1) > :qry_p0) and (qry_1.city = \'cpt\')')
+
+	# aggregates can't be filtered or aggregated again in the same select
+	query = sample_query(
+		'people |> aggregate(group(city), total = sum(age)) |> filter(total > 30) '
+		'|> aggregate(group(), n = sum(total))')
+	assert query._render_query().query == (
+		'select sum(qry_2.total) as n from ('
+		'select qry_1.city, sum(qry_1.age) as total from people qry_1 group by qry_1.city having (sum(qry_1.age)) > 30'
+		') qry_2')
+	assert query.execute().table.to_pydict() == {'n': [53]}
+
+	# filters on the rhs of a cross join can move out of it
+	query = sample_query('people |> cross_join(cities |> filter(country == "za")) |> select(name, country)')
+	assert query._render_query().query == (
+		'select qry_1.name, qry_2.country from people qry_1 cross join cities qry_2 where qry_2.country = \'za\'')
+
+def test_pruned_sql() -> None:
+	query = sample_query('people |> filter(age > 26) |> select(name)')
+	assert query._render_query(flatten = False).query == (
+		'select name from (select * from (select name, age from people) qry_1 where age > 26) qry_2')
+
+	# mutations and aggregations nothing reads aren't computed at all
+	query = sample_query(
+		'people |> mutate(double = age * 2, half = age / 2)'
+		' |> aggregate(group(city), n = sum(double), m = sum(half)) |> select(n)')
+	assert query._render_query(flatten = False).query == (
+		'select n from (select city, sum(double) as n from ('
+		'select age, city, age * 2 as double from (select age, city from people) qry_1'
+		') qry_2 group by city) qry_3')
+	assert query.execute().table.to_pydict() == {'n': [106, 54]}
+
+	# each side of a join only keeps what's read from it, and still selects something if that's nothing
+	query = sample_query('people |> cross_join(cities |> select(country)) |> select(name)')
+	assert query._render_query().query == 'select qry_1.name from people qry_1 cross join cities qry_2'
+	assert query.execute().table.num_rows == 9
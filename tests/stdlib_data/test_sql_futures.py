@@ -0,0 +1,67 @@
+from typing import Any, Dict, Optional
+from time import sleep, monotonic
+from threading import Lock
+
+import pyarrow
+import pytest
+
+from qry.lang import Int
+from qry.runtime import QryRuntimeError
+from qry.stdlib.data.futures import collect_async, await_, gather
+from qry.stdlib.data.sql import QueryPipeline, From
+from qry.stdlib.data.sql_connection import Connection
+from qry.stdlib.data.sql_pool import ConnectionPool
+
+class SlowFetch:
+	def __init__(self) -> None:
+		self.running = 0
+		self.max_running = 0
+		self.lock = Lock()
+
+	def __call__(self, conn: Connection, sql: str, params: Dict[str, Any], columns: Dict[str, type]) -> Optional[Any]:
+		with self.lock:
+			self.running += 1
+			self.max_running = max(self.max_running, self.running)
+		sleep(0.05)
+		with self.lock:
+			self.running -= 1
+
+		if 'missing' in sql:
+			raise QryRuntimeError('no such table')
+		return pyarrow.table({'a': [1, 2, 3]})
+
+def _query(conn: Connection, table: str = 't') -> QueryPipeline:
+	return QueryPipeline(conn, [From(table, {'a': Int})])
+
+def test_queries_run_concurrently() -> None:
+	fetch = SlowFetch()
+	pool = ConnectionPool(lambda: object(), max_size = 4)
+	conn = Connection(None, lambda conn, table: {}, bulk_fetch = fetch, pool = pool)
+
+	futures = [collect_async(_query(conn)) for _ in range(8)]
+	gather(*futures)
+
+	assert fetch.max_running == 4
+	assert all(await_(f).table.num_rows == 3 for f in futures)
+
+def test_unpooled_connections_run_one_query_at_a_time() -> None:
+	fetch = SlowFetch()
+	conn = Connection(object(), lambda conn, table: {}, bulk_fetch = fetch) # type: ignore
+
+	gather(*[collect_async(_query(conn)) for _ in range(3)])
+	assert fetch.max_running == 1
+
+	# queries on the calling thread wait for the background ones too
+	future = collect_async(_query(conn))
+	assert _query(conn).execute().table.num_rows == 3
+	await_(future)
+	assert fetch.max_running == 1
+
+def test_errors_surface_when_awaited() -> None:
+	conn = Connection(object(), lambda conn, table: {}, bulk_fetch = SlowFetch()) # type: ignore
+
+	future = collect_async(_query(conn, 'missing'))
+	with pytest.raises(QryRuntimeError, match = 'no such table'):
+		await_(future)
+	with pytest.raises(QryRuntimeError, match = 'no such table'):
+		gather(collect_async(_query(conn)), future)
@@ -0,0 +1,70 @@
+from typing import Any, Dict, List
+
+import pytest
+
+from qry.runtime import QryRuntimeError
+
+from ..sql_helpers import sample_query
+
+def _results(source: str, flatten: bool) -> Dict[str, List[Any]]:
+	query = sample_query(source)
+	return dict(query._fetch(query._render_query(flatten)).table.to_pydict())
+
+joins = [
+	('people |> inner_join(cities, city) |> select(name, country)', {
+		'name': ['ruan', 'ruanlater', 'thirdperson'],
+		'country': ['za', 'za', 'za'],
+	}),
+	('people |> left_join(cities |> filter(country == "uk"), city) |> select(name, country)', {
+		'name': ['ruan', 'ruanlater', 'thirdperson'],
+		'country': [None, None, None],
+	}),
+	('people |> mutate(place = city) |> inner_join(cities, place == city, age > 26) |> select(name, country)', {
+		'name': ['ruanlater', 'thirdperson'],
+		'country': ['za', 'za'],
+	}),
+	('people |> inner_join(cities, city) |> aggregate(group(country), total = sum(age))', {
+		'country': ['za'],
+		'total': [80],
+	}),
+	('cities |> semi_join(people |> filter(age > 26), city) |> select(city)', {
+		'city': ['cpt', 'jhb'],
+	}),
+	('cities |> anti_join(people, city) |> select(city)', {
+		'city': ['ldn'],
+	}),
+]
+
+@pytest.mark.parametrize('source, expected', joins)
+@pytest.mark.parametrize('flatten', [True, False])
+def test_joins(source: str, expected: Dict[str, List[Any]], flatten: bool) -> None:
+	results = _results(source, flatten)
+	assert sorted(zip(*results.values())) == sorted(zip(*expected.values()))
+
+def test_join_sql() -> None:
+	query = sample_query('people |> inner_join(cities |> filter(country == "za"), city) |> select(name, country)')
+	assert query._render_query().query == (
+		'select qry_1.name, qry_2.country from people qry_1 inner join cities qry_2 on qry_1.city = qry_2.city '
+		'where qry_2.country = \'za\'')
+
+	# filtering the rhs of a left join before joining isn't the same as filtering afterwards
+	query = sample_query('people |> left_join(cities |> filter(country == "za"), city) |> select(name, country)')
+	assert query._render_query().query == (
+		'select qry_1.name, qry_3.country from people qry_1 left join ('
+		'select qry_2.city, qry_2.country from cities qry_2 where qry_2.country = \'za\''
+		') qry_3 on qry_1.city = qry_3.city')
+
+	query = sample_query('cities |> anti_join(people |> filter(age > 26), city)')
+	assert query._render_query().query == (
+		'select qry_1.city, qry_1.country from cities qry_1 '
+		'where not exists (select 1 from people qry_2 where (qry_2.age > 26) and (qry_1.city = qry_2.city))')
+
+def test_join_keys() -> None:
+	with pytest.raises(QryRuntimeError, match = 'needs at least one key'):
+		sample_query('people |> inner_join(cities)')
+
+	with pytest.raises(QryRuntimeError, match = 'not a column of both sides: country'):
+		sample_query('people |> left_join(cities, country)')._render_query()
+
+	with pytest.raises(QryRuntimeError, match = 'as a join key'):
+		sample_query('people |> semi_join(cities, city + 1)')._render_query()
@@ -0,0 +1,84 @@
+from typing import Any, List
+
+from qry.interpreter import Interpreter
+from qry.stdlib.data.sql import QueryPipeline
+
+from ..eval_helpers import parser
+
+def _render(source: str) -> Any:
+	interpreter = Interpreter()
+	results: List[Any] = [interpreter.eval(e) for e in parser.parse('use data::* ' + source)]
+	query = results[-1]
+	assert isinstance(query, QueryPipeline)
+	return query._render_query()
+
+def test_interpolated_values_are_bound() -> None:
+	queries = [_render(f'''
+	conn <- connect_sqlite(":memory:")
+	execute(conn, "create table t (name text, age integer)")
+	execute(conn, "insert into t values ('a', 1)")
+	max_age <- {max_age}
+	get_table(conn, "t") |> filter(age <= {{{{max_age}}}} && name != {{{{"b"}}}})
+	''') for max_age in [26, 27]]
+
+	assert queries[0].query == queries[1].query
+	assert ':qry_p0' in queries[0].query and ':qry_p1' in queries[0].query
+	assert queries[0].params == {'qry_p0': 26, 'qry_p1': 'b'}
+	assert queries[1].params == {'qry_p0': 27, 'qry_p1': 'b'}
+
+class FakeCursor:
+	def __init__(self) -> None:
+		self.executed: List[Any] = []
+		self.name = None
+
+	def execute(self, sql: str, params: Any = None) -> None:
+		if sql.startswith('prepare') and 'unpreparable' in sql:
+			raise Exception('could not determine data type')
+		self.executed.append((sql, params))
+
+class FakeConn:
+	def cursor(self) -> Any:
+		return FakeCursor()
+
+def test_postgres_statements_are_prepared_once() -> None:
+	from qry.stdlib.data.db_postgres import _postgres_execute_prepared
+	from qry.stdlib.data.sql_connection import Connection
+
+	conn = Connection(FakeConn(), lambda conn, table: {}, placeholder = '%s') # type: ignore
+	cursor = FakeCursor()
+	sql = "select * from t where age <= %(qry_p0)s and name like 'a%%' and name <> %(qry_p1)s"
+
+	_postgres_execute_prepared(conn, cursor, sql, {'qry_p0': 26, 'qry_p1': 'b'}) # type: ignore
+	_postgres_execute_prepared(conn, cursor, sql, {'qry_p0': 27, 'qry_p1': 'c'}) # type: ignore
+
+	prepare, first, second = cursor.executed
+	statement = prepare[0].split()[1]
+	assert prepare == (
+		f"prepare {statement} (bigint, text) as select * from t where age <= $1 and name like 'a%' and name <> $2",
+		None,
+	)
+	assert first == (f'execute {statement} (%(qry_p0)s, %(qry_p1)s)', {'qry_p0': 26, 'qry_p1': 'b'})
+	assert second[1] == {'qry_p0': 27, 'qry_p1': 'c'}
+
+	# a different parameter type needs a statement of its own, and failing to prepare falls back to a plain query
+	_postgres_execute_prepared(conn, cursor, sql, {'qry_p0': 26.5, 'qry_p1': 'b'}) # type: ignore
+	assert cursor.executed[3][0].startswith('prepare') and '(double precision, text)' in cursor.executed[3][0]
+
+	unpreparable = 'select %(qry_p0)s as unpreparable'
+	_postgres_execute_prepared(conn, cursor, unpreparable, {'qry_p0': 1}) # type: ignore
+	_postgres_execute_prepared(conn, cursor, unpreparable, {'qry_p0': 2}) # type: ignore
+	assert cursor.executed[-2:] == [(unpreparable, {'qry_p0': 1}), (unpreparable, {'qry_p0': 2})]
+
+def test_cached_results_depend_on_param_types() -> None:
+	interpreter = Interpreter()
+	results: List[Any] = [interpreter.eval(e) for e in parser.parse('''
+	use data::*
+	conn <- connect_sqlite(":memory:") |> cache_results()
+	execute(conn, "create table t (a integer)")
+	execute(conn, "insert into t values (3)")
+	get_table(conn, "t") |> mutate(b = a / {{2}}) |> collect()
+	get_table(conn, "t") |> mutate(b = a / {{2.0}}) |> collect()
+	''')]
+
+	assert results[-2].table.to_pydict() == {'a': [3], 'b': [1]}
+	assert results[-1].table.to_pydict() == {'a': [3], 'b': [1.5]}
@@ -0,0 +1,155 @@
+from typing import Any, List
+import sqlite3
+
+import pytest
+
+from qry.runtime import QryRuntimeError
+from qry.stdlib.data.sql_pool import ConnectionPool, get_pool, close_pools
+from qry.stdlib.data.sql_connection import Connection
+from qry.stdlib.data.db_sqlite import connect_sqlite
+
+class FakeConn:
+	def __init__(self) -> None:
+		self.closed = False
+		self.healthy = True
+
+	def close(self) -> None:
+		self.closed = True
+
+def _pool(opened: List[FakeConn], **kwargs: Any) -> ConnectionPool:
+	def connect() -> FakeConn:
+		conn = FakeConn()
+		opened.append(conn)
+		return conn
+
+	return ConnectionPool(connect, ping = lambda conn: conn.healthy, **kwargs)
+
+def test_reuses_most_recently_released() -> None:
+	opened: List[FakeConn] = []
+	pool = _pool(opened)
+
+	a = pool.acquire()
+	b = pool.acquire()
+	pool.release(a)
+	pool.release(b)
+
+	assert pool.acquire() is b
+	assert pool.acquire() is a
+	assert len(opened) == 2
+
+def test_size_limit() -> None:
+	opened: List[FakeConn] = []
+	pool = _pool(opened, max_size = 1, timeout = 0.01)
+
+	conn = pool.acquire()
+	with pytest.raises(QryRuntimeError, match = 'all 1 are in use'):
+		pool.acquire()
+
+	pool.release(conn)
+	assert pool.acquire() is conn
+
+def test_evicts_idle_connections() -> None:
+	opened: List[FakeConn] = []
+	pool = _pool(opened, max_idle = 0)
+
+	conn = pool.acquire()
+	pool.release(conn)
+
+	assert pool.acquire() is not conn
+	assert conn.closed
+
+def test_checks_connections_before_reuse() -> None:
+	opened: List[FakeConn] = []
+	pool = _pool(opened, check_after = 0)
+
+	conn = pool.acquire()
+	conn.healthy = False
+	pool.release(conn)
+
+	assert pool.acquire() is not conn
+	assert conn.closed
+	assert pool.in_use == 1
+
+def test_checkout() -> None:
+	opened: List[Any] = []
+	pool = _pool(opened)
+	conn = Connection(None, lambda conn, table: {}, pool = pool)
+
+	with pytest.raises(QryRuntimeError, match = 'checked out'):
+		conn.c
+
+	with conn.checkout() as checked_out:
+		assert checked_out.c is opened[0]
+		assert pool.in_use == 1
+
+	assert pool.in_use == 0
+	assert pool.idle[0][0] is opened[0]
+
+	# connections that saw an error get checked before their next use
+	with pytest.raises(ValueError):
+		with conn.checkout():
+			raise ValueError()
+	assert pool.idle[0][1] == float('-inf')
+
+def test_connect_calls_share_a_pool(tmp_path: Any) -> None:
+	path = str(tmp_path / 'pooled.sqlite')
+	try:
+		first = connect_sqlite(path, pool_size = 10)
+		second = connect_sqlite(path, pool_size = 10)
+		assert first.pool is not None and first.pool is second.pool
+
+		with first.checkout() as conn:
+			conn.c.cursor().execute('create table t (a integer)')
+		with second.checkout() as conn:
+			assert conn.c.cursor().execute('select count(*) from t').fetchall() == [(0, )]
+
+		assert len(first.pool.idle) == 1
+		assert get_pool(('sqlite', path), lambda: None, 10) is first.pool
+
+		# in memory dbs aren't shared between connections, so they're never pooled
+		assert connect_sqlite(':memory:', pool_size = 10).pool is None
+		assert isinstance(connect_sqlite(path).c, sqlite3.Connection)
+	finally:
+		close_pools()
+
+def test_session_state_is_not_shared(tmp_path: Any) -> None:
+	from qry.stdlib.data.sql import execute
+
+	try:
+		conn = connect_sqlite(str(tmp_path / 'sessions.sqlite'), pool_size = 10)
+		assert conn.pool is not None
+		execute(conn, 'create table t (a integer)')
+		execute(conn, 'insert into t values (1)')
+		assert len(conn.pool.idle) == 1
+
+		# connections left in a transaction or holding temp tables are closed rather than reused
+		reused = conn.pool.idle[0][0]
+		execute(conn, 'begin')
+		assert conn.pool.idle == [] and conn.pool.in_use == 0
+		with pytest.raises(sqlite3.ProgrammingError):
+			reused.cursor()
+
+		execute(conn, 'create temp table scratch (a integer)')
+		with pytest.raises(sqlite3.OperationalError, match = 'no such table'):
+			execute(conn, 'select * from scratch')
+
+		execute(conn, 'insert into t values (2)')
+		with conn.checkout() as checked_out:
+			assert checked_out.c.cursor().execute('select count(*) from t').fetchall() == [(2, )]
+	finally:
+		close_pools()
+
+def test_unpooled_connections_keep_their_session(tmp_path: Any) -> None:
+	from qry.stdlib.data.sql import execute, get_table
+
+	conn = connect_sqlite(str(tmp_path / 'session.sqlite'))
+	assert conn.pool is None
+
+	execute(conn, 'create temp table scratch (a integer)')
+	execute(conn, 'insert into scratch values (1)')
+	assert get_table(conn, 'scratch').execute().table.to_pydict() == {'a': [1]}
+
+	execute(conn, 'begin')
+	execute(conn, 'insert into scratch values (2)')
+	execute(conn, 'rollback')
+	assert get_table(conn, 'scratch').execute().table.to_pydict() == {'a': [1]}
@@ -0,0 +1,79 @@
+from typing import Dict, List
+from types import SimpleNamespace
+import sqlite3
+
+import pytest
+
+from qry.lang import Int, Float, String
+from qry.runtime import QryRuntimeError
+from qry.stdlib.data.sql import get_table, prefetch_schemas, refresh_schemas, execute, metadata_from_typecode_lookup
+from qry.stdlib.data.db_mysql import _typecode_map, _mysql_column_typecodes
+from qry.stdlib.data.sql_connection import Connection
+from qry.stdlib.data.db_sqlite import _sqlite_metadata, _sqlite_all_metadata
+
+def _conn(lookups: List[str]) -> Connection:
+	def get_table_metadata(conn: Connection, table: str) -> Dict[str, type]:
+		lookups.append(table)
+		return _sqlite_metadata(conn, table)
+
+	c = sqlite3.connect(':memory:', isolation_level = None)
+	c.execute('create table people (name varchar(255), age integer, height real)')
+	c.execute('create table untyped (a, b)')
+	c.execute("insert into untyped values (1, 'x')")
+	return Connection(c, get_table_metadata, get_all_table_metadata = _sqlite_all_metadata) # type: ignore
+
+def test_schemas_are_cached() -> None:
+	lookups: List[str] = []
+	conn = _conn(lookups)
+
+	get_table(conn, 'people')
+	get_table(conn, 'people')
+	assert lookups == ['people']
+
+	refresh_schemas(conn, 'people')
+	get_table(conn, 'people')
+	assert lookups == ['people', 'people']
+
+	# only statements which can change a schema drop the cache
+	execute(conn, "insert into people values ('a', 1, 1.5)")
+	get_table(conn, 'people')
+	execute(conn, 'alter table people add column nickname text')
+	assert get_table(conn, 'people').steps[0].columns == {
+		'name': String,
+		'age': Int,
+		'height': Float,
+		'nickname': String,
+	}
+	assert lookups == ['people', 'people', 'people']
+
+def test_prefetch() -> None:
+	lookups: List[str] = []
+	conn = _conn(lookups)
+
+	# tables with columns of no declared type are left to get_table
+	assert prefetch_schemas(conn) == 1
+	get_table(conn, 'people')
+	get_table(conn, 'untyped')
+	assert lookups == ['untyped']
+	assert conn.schemas['untyped'] == {'a': Int, 'b': String}
+
+	refresh_schemas(conn)
+	assert prefetch_schemas(conn, 'untyped') == 0
+	assert prefetch_schemas(conn, 'people', 'missing') == 1
+	assert list(conn.schemas) == ['people']
+
+def test_mysql_binary_blobs_are_not_text() -> None:
+	def conn(*fields: SimpleNamespace) -> Connection:
+		cursor = SimpleNamespace(
+			execute = lambda sql: None,
+			fetchall = lambda: [],
+			_result = SimpleNamespace(fields = fields),
+		)
+		return Connection(SimpleNamespace(cursor = lambda: cursor), lambda conn, table: {})
+
+	get_metadata = metadata_from_typecode_lookup(_typecode_map, _mysql_column_typecodes)
+	text = SimpleNamespace(name = 'notes', type_code = 252, charsetnr = 33)
+	blob = SimpleNamespace(name = 'data', type_code = 252, charsetnr = 63)
+	assert get_metadata(conn(text), 't') == {'notes': String}
+	with pytest.raises(QryRuntimeError, match = 'unhandled typecode: binary blob'):
+		get_metadata(conn(text, blob), 't')
@@ -0,0 +1,29 @@
+from typing import Any
+
+import pyarrow
+import pytest
+
+from qry.stdlib.data.dataframe import DataFrame
+from qry.stdlib.data.db_sqlite import connect_sqlite
+from qry.stdlib.data.sql import get_table, write_table
+
+def test_failed_replace_keeps_old_rows() -> None:
+	conn = connect_sqlite(':memory:')
+	write_table(conn, DataFrame(pyarrow.table({'a': [1, 2]})), 't')
+
+	def failing_insert(*args: Any) -> None:
+		raise ValueError('insert failed')
+
+	conn.bulk_insert = failing_insert
+	with pytest.raises(ValueError, match = 'insert failed'):
+		write_table(conn, DataFrame(pyarrow.table({'b': ['x']})), 't', 'replace')
+
+	assert conn.c.cursor().execute('select * from t').fetchall() == [(1, ), (2, )]
+
+def test_bools_round_trip() -> None:
+	conn = connect_sqlite(':memory:')
+	write_table(conn, DataFrame(pyarrow.table({'flag': [True, False, None], 'n': [1, 0, 2]})), 't')
+
+	table = get_table(conn, 't').execute().table
+	assert table.schema.types == [pyarrow.bool_(), pyarrow.int64()]
+	assert table.to_pydict() == {'flag': [True, False, None], 'n': [1, 0, 2]}
@@ -1,3 +1,5 @@
+from qry.runtime import QryRuntimeError
+
 from ..eval_helpers import data_driven_test
 
 test_op_lib = data_driven_test([
@@ -27,4 +29,13 @@ test_op_lib = data_driven_test([
 	('to_string(1 + 1)', '2'),
 	('to_string("some string")', 'some string'),
 	('cast(Int, 2.5)', 2),
+	('true && false', False),
+	('true && true', True),
+	('false || true', True),
+	('false || false', False),
+	('false && not_defined', False),
+	('true || not_defined', True),
+	('false & not_defined', QryRuntimeError('not found: not_defined')),
+	('true && not_defined', QryRuntimeError('not found: not_defined')),
+	('1 == 1 && 2 == 2 || false', True),
 ])